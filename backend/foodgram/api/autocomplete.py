@@ -0,0 +1,93 @@
+import threading
+from bisect import bisect_left
+
+from django.db import DatabaseError
+from recipe.cache import get_version
+from recipe.models import Ingredient
+
+
+class IngredientIndex:
+    """ Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Отсортированный массив названий отвечает на поиск по началу строки,
+    индекс триграмм - на поиск по вхождению подстроки. Индекс строится
+    заново, когда меняется версия справочника ингредиентов. """
+    ngram_size = 3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+
+    @classmethod
+    def split(cls, name):
+        return {name[i:i + cls.ngram_size]
+                for i in range(len(name) - cls.ngram_size + 1)}
+
+    def invalidate(self):
+        self._data = None
+
+    def build(self, version):
+        entries = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda entry: (entry['name'].casefold(), entry['id']))
+        names = [entry['name'].casefold() for entry in entries]
+        ngrams = {}
+        for position, name in enumerate(names):
+            for ngram in self.split(name):
+                ngrams.setdefault(ngram, []).append(position)
+        self._data = (entries, names, ngrams)
+        self._version = version
+        return self._data
+
+    def warm_up(self):
+        """ Строит индекс при старте процесса, если база уже готова. """
+        try:
+            self.get_data()
+        except DatabaseError:
+            self.invalidate()
+
+    def get_data(self):
+        version = get_version('ingredients')
+        if self._data is not None and self._version == version:
+            return self._data
+        with self._lock:
+            if self._data is not None and self._version == version:
+                return self._data
+            return self.build(version)
+
+    def get_infix(self, query, names, ngrams):
+        """ Позиции названий, содержащих query не с начала строки. """
+        if len(query) < self.ngram_size:
+            candidates = range(len(names))
+        else:
+            postings = sorted((ngrams.get(ngram, ()) for ngram in
+                               self.split(query)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+            candidates = sorted(candidates)
+        for position in candidates:
+            name = names[position]
+            if query in name and not name.startswith(query):
+                yield position
+
+    def search(self, query, limit=None):
+        """ Ингредиенты, чьи названия начинаются с query, а затем
+        содержащие его в середине. """
+        entries, names, ngrams = self.get_data()
+        query = query.strip().casefold()
+        if not query:
+            return entries[:limit]
+        found = []
+        for position in range(bisect_left(names, query), len(names)):
+            if not names[position].startswith(query) or (
+                    limit is not None and len(found) >= limit):
+                break
+            found.append(position)
+        for position in self.get_infix(query, names, ngrams):
+            if limit is not None and len(found) >= limit:
+                break
+            found.append(position)
+        return [entries[position] for position in found]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,260 @@
+import gzip
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db.models import Max
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import (get_conditional_response, parse_etags,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date
+from recipe.cache import get_user_state_namespace, get_version, get_versions
+from recipe.models import Recipe
+from rest_framework.renderers import JSONRenderer
+
+from .filters import RecipeOrderingFilter
+
+
+def etag_matches(request, etag):
+    """ Слабое сравнение ETag с заголовком If-None-Match. """
+    def strip(tag):
+        return tag[2:] if tag.startswith('W/') else tag
+
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return '*' in etags or strip(etag) in map(strip, etags)
+
+
+class CachedListMixin:
+    """ Отдает список справочных данных готовыми байтами из кэша.
+
+    Ответ хранится под ключом версии данных вместе со сжатой копией и ETag
+    от содержимого, поэтому повторные запросы получают 304 Not Modified,
+    пока не изменятся сами данные, а не их версия в кэше. """
+    cache_namespace = None
+
+    def get_cached_payload(self, version):
+        key = f'{self.cache_namespace}:{version}'
+        payload = cache.get(key)
+        if payload is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            body = JSONRenderer().render(
+                self.get_serializer(queryset, many=True).data)
+            payload = (body, gzip.compress(body),
+                       f'W/"{hashlib.md5(body).hexdigest()}"')
+            cache.set(key, payload, settings.REFERENCE_CACHE_TIMEOUT)
+        return payload
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        body, compressed, etag = self.get_cached_payload(
+            get_version(self.cache_namespace))
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = HttpResponse(
+                compressed, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        patch_cache_control(response, public=True,
+                            max_age=settings.REFERENCE_CACHE_MAX_AGE)
+        return response
+
+
+class ResponseCacheStats:
+    """ Счетчики кэша ответов, хранятся в нем же. """
+    names = ('hits', 'misses', 'stale', 'waits', 'stored', 'stored_bytes')
+
+    def __init__(self, response_cache):
+        self.cache = response_cache
+
+    def add(self, name, value=1):
+        key = f'stats:{name}'
+        try:
+            self.cache.incr(key, value)
+        except ValueError:
+            if not self.cache.add(key, value, None):
+                self.cache.incr(key, value)
+
+    def get(self):
+        stored = self.cache.get_many([f'stats:{name}' for name in self.names])
+        stats = {name: stored.get(f'stats:{name}', 0) for name in self.names}
+        requests = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / requests if requests else None
+        return stats
+
+
+def get_response_key(request):
+    """ Ключ ответа: схема, хост, путь и параметры запроса в отсортированном
+    виде. Схема и хост входят в ключ, потому что ответ содержит абсолютные
+    ссылки на соседние страницы. """
+    query = urlencode(sorted(
+        (name, value) for name, values in request.query_params.lists()
+        for value in values))
+    url = request.build_absolute_uri(request.path)
+    digest = hashlib.md5(f'{url}?{query}'.encode()).hexdigest()
+    return f'response:{digest}'
+
+
+def get_recipe_tags(recipe):
+    """ Наборы данных, из которых собран ответ с рецептом. """
+    return {
+        f'recipe:{recipe["id"]}', f'user:{recipe["author"]["id"]}',
+        *(f'tag:{tag["id"]}' for tag in recipe['tags']),
+        *(f'ingredient:{ingredient["id"]}'
+          for ingredient in recipe['ingredients'])}
+
+
+class AnonymousCacheMixin:
+    """ Кэширует ответы списка и страницы рецепта для анонимов.
+
+    Для анонимных пользователей ответ одинаков, поэтому он хранится в кэше
+    responses по пути и параметрам запроса вместе с версиями рецептов,
+    авторов, тегов и ингредиентов, из которых собран. Изменение любого из
+    них меняет версию, и ответ считается устаревшим. Один процесс строит
+    пропавший ответ, остальные ждут его в кэше. """
+    response_cache = caches['responses']
+    response_cache_stats = ResponseCacheStats(response_cache)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_initial_tags(self):
+        """ Наборы данных, известные до построения ответа. Их версии берутся
+        заранее, чтобы изменение во время построения не осталось
+        незамеченным. """
+        if self.action == 'retrieve':
+            return {f'recipe:{self.kwargs[self.lookup_field]}'}
+        return {'recipes'}
+
+    def get_response_tags(self, data):
+        if self.action == 'retrieve':
+            return get_recipe_tags(data)
+        recipes = data['results'] if isinstance(data, dict) else data
+        tags = set()
+        for recipe in recipes:
+            tags |= get_recipe_tags(recipe)
+        return tags
+
+    def get_fresh_body(self, key):
+        entry = self.response_cache.get(key)
+        if entry is None:
+            return None
+        versions, body = entry
+        if get_versions(versions) != versions:
+            self.response_cache_stats.add('stale')
+            return None
+        return body
+
+    def wait_for_body(self, key):
+        """ Ждет ответ, который строит другой процесс. """
+        self.response_cache_stats.add('waits')
+        deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            body = self.get_fresh_body(key)
+            if body is not None:
+                return body
+        return None
+
+    def get_cached_response(self, view, request, *args, **kwargs):
+        if (request.user.is_authenticated
+                or request.accepted_renderer.format != 'json'):
+            return view(request, *args, **kwargs)
+        key = get_response_key(request)
+        body = self.get_fresh_body(key)
+        lock = f'{key}:lock'
+        locked = False
+        if body is None:
+            locked = self.response_cache.add(
+                lock, 1, settings.RESPONSE_CACHE_LOCK_TIMEOUT)
+            if not locked:
+                body = self.wait_for_body(key)
+        if body is not None:
+            self.response_cache_stats.add('hits')
+            response = HttpResponse(body, content_type='application/json')
+            response['X-Cache'] = 'HIT'
+            return response
+        self.response_cache_stats.add('misses')
+        try:
+            initial = get_versions(self.get_initial_tags())
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                versions = get_versions(self.get_response_tags(response.data))
+                versions.update(initial)
+                body = JSONRenderer().render(response.data)
+                self.response_cache.set(
+                    key, (versions, body), settings.RESPONSE_CACHE_TIMEOUT)
+                self.response_cache_stats.add('stored')
+                self.response_cache_stats.add('stored_bytes', len(body))
+        finally:
+            # Не дождавшийся ответа запрос строит его без блокировки и не
+            # снимает чужую
+            if locked:
+                self.response_cache.delete(lock)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class ConditionalRecipeMixin:
+    """ Отвечает 304 Not Modified на повторные запросы рецептов.
+
+    Валидатор считается одним запросом по датам изменения рецептов до
+    сериализации: для страницы рецепта - его дата, для списка - последняя
+    дата отфильтрованных рецептов и версия рецептов, которая меняется и при
+    удалении. Для пользователя к нему добавляется версия его избранного,
+    корзины и подписок. Last-Modified отдается только анонимам на странице
+    рецепта, где он не зависит от удалений и данных пользователя. """
+    # Порядок по популярности меняется без изменения самих рецептов
+    unconditional_orderings = ('popularity',)
+
+    def list(self, request, *args, **kwargs):
+        ordering = request.query_params.get(
+            RecipeOrderingFilter.ordering_param, '').lstrip('-')
+        if ordering in self.unconditional_orderings:
+            return super().list(request, *args, **kwargs)
+        updated = self.filter_queryset(Recipe.objects.all()).order_by(
+        ).aggregate(updated=Max('updated'))['updated']
+        return self.get_conditional_response(
+            request, f'{updated}:{get_version("recipes")}', None,
+            super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        updated = Recipe.objects.filter(
+            pk=kwargs[self.lookup_field]).values_list(
+            'updated', flat=True).first()
+        if updated is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.get_conditional_response(
+            request, str(updated), updated, super().retrieve,
+            *args, **kwargs)
+
+    def get_conditional_response(self, request, state, updated, view,
+                                 *args, **kwargs):
+        if request.user.is_authenticated:
+            namespace = get_user_state_namespace(request.user.pk)
+            state += f':{get_version(namespace)}'
+            updated = None
+        etag = 'W/"{}"'.format(hashlib.md5(state.encode()).hexdigest())
+        last_modified = updated and int(updated.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization', 'Cookie'))
+        return response
@@ -0,0 +1,105 @@
+import json
+
+from django.db import transaction
+from django.db.models import Prefetch
+from recipe.models import IngredientInRecipe, Recipe, RecipeDocument
+from rest_framework import serializers
+
+from .serializers import RecipeSerializer, UserSerializer
+
+# Поля, которые зависят от пользователя и не хранятся в документе
+USER_FIELDS = ('is_favorited', 'is_in_shopping_cart')
+
+
+class AuthorDocumentSerializer(UserSerializer):
+    class Meta(UserSerializer.Meta):
+        fields = tuple(field for field in UserSerializer.Meta.fields
+                       if field != 'is_subscribed')
+
+
+class RecipeDocumentSerializer(RecipeSerializer):
+    """ Часть представления рецепта, одинаковая для всех пользователей. """
+    author = AuthorDocumentSerializer()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = tuple(field for field in RecipeSerializer.Meta.fields
+                       if field not in USER_FIELDS)
+
+
+def render_documents(recipes):
+    """ Документы рецептов с переданными id: {id: данные}. """
+    return {
+        recipe.pk: RecipeDocumentSerializer(recipe).data
+        for recipe in Recipe.objects.filter(
+            pk__in=recipes
+        ).select_related('author').prefetch_related(
+            'tags',
+            Prefetch('ingredients',
+                     queryset=IngredientInRecipe.objects.select_related(
+                         'ingredient')))}
+
+
+def save_documents(documents, replace=True):
+    """ Сохраняет документы. Без replace существующие не перезаписываются,
+    так параллельные ленивые построения не мешают друг другу. """
+    with transaction.atomic():
+        if replace:
+            RecipeDocument.objects.filter(recipe_id__in=documents).delete()
+        RecipeDocument.objects.bulk_create([
+            RecipeDocument(recipe_id=recipe, data=json.dumps(
+                document, ensure_ascii=False))
+            for recipe, document in documents.items()
+        ], ignore_conflicts=True)
+
+
+def build_documents(recipes, replace=True):
+    documents = render_documents(recipes)
+    save_documents(documents, replace)
+    return documents
+
+
+def get_document(recipe):
+    """ Документ рецепта из with_documents или построенный заново. """
+    document = getattr(recipe, 'built_document', None)
+    if document is not None:
+        return document
+    try:
+        return json.loads(recipe.document.data)
+    except RecipeDocument.DoesNotExist:
+        return build_documents([recipe.pk], replace=False)[recipe.pk]
+
+
+class RecipeReadListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(data)
+        missing = []
+        for recipe in recipes:
+            try:
+                recipe.document
+            except RecipeDocument.DoesNotExist:
+                missing.append(recipe)
+        if missing:
+            documents = build_documents(
+                [recipe.pk for recipe in missing], replace=False)
+            for recipe in missing:
+                recipe.built_document = documents[recipe.pk]
+        return super().to_representation(recipes)
+
+
+class RecipeReadSerializer(serializers.BaseSerializer):
+    """ Рецепт из готового документа с флагами текущего пользователя.
+
+    Рецепты берутся из Recipe.objects.with_documents, недостающие
+    документы строятся пачкой и сохраняются. """
+
+    class Meta:
+        list_serializer_class = RecipeReadListSerializer
+
+    def to_representation(self, recipe):
+        document = get_document(recipe)
+        document['author']['is_subscribed'] = recipe.is_subscribed
+        return {
+            field: (getattr(recipe, field) if field in USER_FIELDS
+                    else document[field])
+            for field in RecipeSerializer.Meta.fields}
@@ -0,0 +1,106 @@
+import base64
+import binascii
+import uuid
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from PIL import Image
+from recipe.images import get_renditions
+from rest_framework import serializers
+
+# Размер куска base64 строки, декодируемого за раз
+BASE64_CHUNK_SIZE = 64 * 1024
+# Форматы, которые можно загрузить, и расширения файлов для них
+IMAGE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+def decode_base64(data, start):
+    """ Декодирует base64 строку кусками. Пробелы и переносы строк
+    пропускаются, а хвост куска, не кратный 4 символам, переносится в
+    следующий кусок. """
+    rest = ''
+    for position in range(start, len(data), BASE64_CHUNK_SIZE):
+        chunk = rest + ''.join(
+            data[position:position + BASE64_CHUNK_SIZE].split())
+        end = len(chunk) - len(chunk) % 4
+        rest = chunk[end:]
+        yield base64.b64decode(chunk[:end])
+    yield base64.b64decode(rest)
+
+
+class ImageRenditionsField(serializers.Field):
+    """ Адреса уменьшенных копий картинки рецепта. """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        renditions = get_renditions(recipe)
+        if renditions is None:
+            return None
+        return {rendition: urljoin(settings.EXTERNAL_ADDRESS, url)
+                for rendition, url in renditions.items()}
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    """ Картинка в виде base64 строки или файла из multipart запроса.
+
+    Размер проверяется до декодирования, строка декодируется кусками во
+    временный файл, а количество пикселей проверяется по заголовку картинки
+    до ее полной загрузки Pillow. """
+    default_error_messages = {
+        'invalid_image': 'Загрузите корректную картинку.',
+        'too_large': 'Размер картинки не должен превышать {max_size} байт.',
+        'too_many_pixels': ('Картинка не должна быть больше '
+                            '{max_pixels} пикселей.'),
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = self.decode(data)
+            data.name = f'{data.name}.{IMAGE_FORMATS[self.check_image(data)]}'
+        elif isinstance(data, UploadedFile):
+            if data.size > settings.MAX_IMAGE_UPLOAD_SIZE:
+                self.fail('too_large',
+                          max_size=settings.MAX_IMAGE_UPLOAD_SIZE)
+            self.check_image(data)
+        else:
+            self.fail('invalid_image')
+        return super().to_internal_value(data)
+
+    def decode(self, data):
+        start = data.find(';base64,')
+        start = 0 if start == -1 else start + len(';base64,')
+        if (len(data) - start) * 3 // 4 > settings.MAX_IMAGE_UPLOAD_SIZE:
+            self.fail('too_large', max_size=settings.MAX_IMAGE_UPLOAD_SIZE)
+        file = TemporaryUploadedFile(
+            uuid.uuid4().hex, 'application/octet-stream', 0, None)
+        try:
+            for part in decode_base64(data, start):
+                file.write(part)
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_image')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
+    def check_image(self, file):
+        """ Проверяет формат и размер картинки, читая только заголовок.
+        Возвращает формат картинки. """
+        try:
+            with Image.open(file) as image:
+                image_format, (width, height) = image.format, image.size
+        except (OSError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        finally:
+            file.seek(0)
+        if image_format not in IMAGE_FORMATS:
+            self.fail('invalid_image')
+        if width * height > settings.MAX_IMAGE_PIXELS:
+            self.fail('too_many_pixels',
+                      max_pixels=settings.MAX_IMAGE_PIXELS)
+        return image_format
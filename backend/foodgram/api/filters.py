@@ -1,23 +1,98 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
-from recipe.models import Recipe
+from recipe.cache import get_tag_ids
+from recipe.models import Basket, Favorite, Recipe, TagOfRecipes
+from recipe.search import search_recipes
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+from rest_framework.settings import api_settings
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
 
 
 class RecipeFilter(filters.FilterSet):
-    """ Фильтр для произведений. """
+    """ Фильтр для произведений.
+
+    Связанные таблицы проверяются коррелированными EXISTS подзапросами, а не
+    соединениями, поэтому строки рецептов не дублируются. """
     is_favorited = filters.BooleanFilter(method="filter_is_set")
     is_in_shopping_cart = filters.BooleanFilter(method="filter_is_set")
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices, method='filter_tags')
     author = filters.NumberFilter(field_name="author__pk")
+    cooking_time_min = filters.NumberFilter(
+        field_name='cooking_time', lookup_expr='gte')
+    cooking_time_max = filters.NumberFilter(
+        field_name='cooking_time', lookup_expr='lte')
 
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags')
+        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags',
+                  'cooking_time_min', 'cooking_time_max')
 
     def filter_is_set(self, queryset, name, value):
-        names = {
-            "is_favorited": "favorites__user",
-            "is_in_shopping_cart": "baskets__user"
+        models = {
+            "is_favorited": Favorite,
+            "is_in_shopping_cart": Basket
         }
-        if value:
-            return queryset.filter(**{names[name]: self.request.user})
-        return queryset.exclude(**{names[name]: self.request.user})
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        # Флаги уже аннотированы в with_user_flags, повторно их не считаем
+        if name not in queryset.query.annotations:
+            queryset = queryset.annotate(**{name: Exists(
+                models[name].objects.filter(
+                    user=user, recipe=OuterRef('pk')))})
+        return queryset.filter(**{name: value})
+
+    @staticmethod
+    def filter_tags(queryset, name, value):
+        tags = get_tag_ids()
+        return queryset.annotate(has_tags=Exists(TagOfRecipes.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=[tags[slug] for slug in value]))
+        ).filter(has_tags=True)
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """ Полнотекстовый поиск по названию, тексту и ингредиентам рецепта.
+
+    Если сортировка не задана явно, результаты упорядочены по
+    релевантности. """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search_recipes(
+            queryset, query,
+            by_rank=api_settings.ORDERING_PARAM not in request.query_params)
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """ Сортировка рецептов по полям с индексами.
+
+    popularity - сначала популярные, cooking_time - сначала быстрые, минус
+    меняет направление. К каждому полю добавляется id в том же направлении,
+    чтобы порядок был однозначным и совпадал с индексом. """
+    orderings = {
+        'id': ('id',),
+        'popularity': ('-popularity', '-id'),
+        'cooking_time': ('cooking_time', 'id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        param = request.query_params.get(self.ordering_param, '').strip()
+        descending = param.startswith('-')
+        fields = self.orderings.get(param.lstrip('-'))
+        if fields is None:
+            return self.get_default_ordering(view)
+        if not descending:
+            return fields
+        return tuple(field[1:] if field.startswith('-') else f'-{field}'
+                     for field in fields)
+
+    def get_valid_fields(self, queryset, view, context=None):
+        return [(param, param) for param in self.orderings]
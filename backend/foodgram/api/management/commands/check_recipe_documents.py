@@ -0,0 +1,59 @@
+import json
+from itertools import islice
+
+from api.documents import render_documents, save_documents
+from django.core.management import BaseCommand
+from recipe.models import Recipe, RecipeDocument
+
+
+class Command(BaseCommand):
+    """ Отсутствующий документ расхождением не считается: документы
+    сбрасываются при изменении рецепта, его картинок, тегов и
+    ингредиентов и строятся заново при первом чтении. """
+    help = ("Сверяет готовые документы рецептов с их текущим "
+            "представлением и при необходимости исправляет устаревшие и "
+            "строит недостающие")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repair', action='store_true',
+            help='Построить недостающие и исправить устаревшие документы')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Количество рецептов, проверяемых за раз')
+
+    def check_batch(self, recipes, repair):
+        expected = render_documents(recipes)
+        stored = dict(RecipeDocument.objects.filter(
+            recipe_id__in=recipes).values_list('recipe_id', 'data'))
+        missing = expected.keys() - stored.keys()
+        stale = [recipe for recipe in expected.keys() & stored.keys()
+                 if json.loads(stored[recipe]) != expected[recipe]]
+        if repair and (missing or stale):
+            save_documents({recipe: expected[recipe]
+                            for recipe in [*missing, *stale]})
+        return len(missing), len(stale)
+
+    def handle(self, *args, **options):
+        missing = stale = 0
+        recipes = Recipe.objects.order_by('pk').values_list(
+            'pk', flat=True).iterator()
+        while True:
+            batch = list(islice(recipes, options['batch_size']))
+            if not batch:
+                break
+            batch_missing, batch_stale = self.check_batch(
+                batch, options['repair'])
+            missing += batch_missing
+            stale += batch_stale
+        if options['repair'] and (missing or stale):
+            self.stdout.write(self.style.SUCCESS(
+                f'Построено документов: {missing}, исправлено: {stale}'))
+        elif stale:
+            self.stdout.write(self.style.WARNING(
+                f'Устарело документов: {stale}, запустите команду с '
+                f'--repair'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Документы рецептов актуальны, еще не построено: '
+                f'{missing}'))
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+def estimate_count(queryset):
+    """ Оценка количества строк по плану запроса PostgreSQL.
+
+    Для остальных баз возвращает точное количество. """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        return cursor.fetchone()[0][0]['Plan']['Plan Rows']
+
+
+class RecipeCursorPagination(CursorPagination):
+    """ Навигация по курсору: следующая страница ищется по индексу от
+    значения поля сортировки, без COUNT(*) и OFFSET. """
+    ordering = ('id',)
+    count_query_param = 'count'
+    page_size_query_param = 'limit'
+    max_page_size = settings.RECIPES_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = (
+            estimate_count(queryset)
+            if request.query_params.get(self.count_query_param) == 'estimate'
+            else None)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+            response.data.move_to_end('count', last=False)
+        return response
+
+
+class RecipePagination(PageNumberPagination):
+    """ Навигация по номеру страницы, а при ?pagination=cursor или
+    переданном курсоре - по курсору.
+
+    Курсор DRF хранит значение только первого поля сортировки, поэтому он
+    используется лишь для сортировок по уникальному полю. При сортировке по
+    популярности, которая часто меняется, или по времени приготовления с
+    большими группами равных значений страницы идут по номерам. """
+    cursor_pagination_class = RecipeCursorPagination
+    cursor_fields = ('id',)
+    mode_query_param = 'pagination'
+    page_size_query_param = 'limit'
+    max_page_size = settings.RECIPES_MAX_PAGE_SIZE
+
+    def use_cursor(self, queryset, request, view):
+        if (request.query_params.get(self.mode_query_param) != 'cursor'
+                and self.cursor_pagination_class.cursor_query_param
+                not in request.query_params):
+            return False
+        ordering = self.cursor_pagination_class().get_ordering(
+            request, queryset, view)
+        return ordering[0].lstrip('-') in self.cursor_fields
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(queryset, request, view):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
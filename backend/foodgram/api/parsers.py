@@ -0,0 +1,22 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import JSONParser
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'request_too_large'
+
+
+class LimitedJSONParser(JSONParser):
+    """ JSON парсер, отклоняющий слишком большие запросы до чтения тела. """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        if request is not None and int(
+                request.META.get('CONTENT_LENGTH') or 0
+        ) > settings.MAX_JSON_BODY_SIZE:
+            raise RequestTooLarge()
+        return super().parse(stream, media_type, parser_context)
@@ -0,0 +1,73 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+def buffered(chunks, size=8 * 1024):
+    """ Склеивает мелкие куски потока в блоки размером около size. """
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+class Echo:
+    """ Файлоподобный объект, возвращающий записанную строку. """
+
+    @staticmethod
+    def write(value):
+        return value
+
+
+class PlainTextRenderer(BaseRenderer):
+    """ Список покупок в виде текста. """
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode(self.charset)
+
+    @staticmethod
+    def stream(rows):
+        empty = True
+        for row in rows:
+            empty = False
+            yield (f'{row["name"]} ({row["measurement_unit"]}): '
+                   f'{row["amount"]}\n')
+        if empty:
+            yield 'shopping cart is empty'
+
+
+class CSVRenderer(PlainTextRenderer):
+    """ Список покупок в формате csv. """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    @staticmethod
+    def stream(rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            yield writer.writerow(
+                (row['name'], row['measurement_unit'], row['amount']))
+
+
+class ShoppingCartJSONRenderer(JSONRenderer):
+    """ Список покупок в виде JSON массива. """
+
+    @staticmethod
+    def stream(rows):
+        yield '['
+        for number, row in enumerate(rows):
+            yield (',' if number else '') + json.dumps(
+                row, ensure_ascii=False)
+        yield ']'
@@ -1,13 +1,18 @@
+import json
 from urllib.parse import urljoin
 
 from django.conf import settings
-from drf_extra_fields.fields import Base64ImageField
-from rest_framework import serializers
-
+from django.db import IntegrityError, transaction
+from django.db.models import Case, When
+from django.http import QueryDict
+from recipe.images import schedule_renditions
 from recipe.models import (Basket, Favorite, Ingredient, IngredientInRecipe,
-                           Recipe, Tag, TagOfRecipes)
+                           Recipe, ShoppingCartItem, Tag, TagOfRecipes)
+from rest_framework import serializers
 from users.models import Subscribe, User
 
+from .fields import ImageRenditionsField, StreamingBase64ImageField
+
 
 class UserSerializer(serializers.ModelSerializer):
     """ Сериализатор для работы с пользователями через права админа. """
@@ -19,9 +24,11 @@ class UserSerializer(serializers.ModelSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         return (request and request.user.is_authenticated
-                and request.user.followers.filter(user=obj).exists())
+                and request.user.followings.filter(author=obj).exists())
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -55,12 +62,6 @@ class IngredientCreateSerializer(serializers.ModelSerializer):
         model = IngredientInRecipe
         fields = ('id', 'amount')
 
-    @staticmethod
-    def validate_id(value):
-        if not Ingredient.objects.filter(id=value).exists():
-            raise serializers.ValidationError('Нет такого ингридиента')
-        return value
-
     @staticmethod
     def validate_amount(value):
         if value < 1:
@@ -76,20 +77,26 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
+    images = ImageRenditionsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time')
+            'is_in_shopping_cart', 'name', 'image', 'images', 'text',
+            'cooking_time')
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and request.user.favorites.filter(
-                    recipe__name=obj).exists())
+                    recipe=obj).exists())
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and request.user.baskets.filter(
@@ -104,7 +111,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = IngredientCreateSerializer(many=True)
     tags = serializers.PrimaryKeyRelatedField(many=True,
                                               queryset=Tag.objects.all())
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
     cooking_time = serializers.IntegerField()
 
     class Meta:
@@ -113,17 +120,51 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'ingredients', 'tags', 'image', 'name', 'text', 'cooking_time')
 
     def to_representation(self, instance):
-        return RecipeSerializer(instance).data
+        instance = Recipe.objects.with_user_flags(
+            self.context.get('request').user).get(pk=instance.pk)
+        return RecipeSerializer(instance, context=self.context).data
+
+    def save(self, **kwargs):
+        # Хранилище перемещает временный файл картинки, и закрыть его надо
+        # сразу, иначе его удаление при сборке мусора пишет ошибку в stderr
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = self.parse_multipart(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def parse_multipart(data):
+        """ В multipart запросе картинка передается файлом, теги - списком
+        значений, а ингредиенты - JSON строкой. """
+        parsed = data.dict()
+        if 'tags' in data:
+            parsed['tags'] = data.getlist('tags')
+        if 'ingredients' in data:
+            try:
+                parsed['ingredients'] = json.loads(data['ingredients'])
+            except ValueError:
+                raise serializers.ValidationError(
+                    {'ingredients': ['Ожидается JSON список ингредиентов']})
+        return parsed
 
     @staticmethod
     def validate_ingredients(value):
         errors = []
         if not value:
             errors.append('Рецепт не может быть без ингредиентов')
-        if not (lambda elems: True if len(elems) == len(set(
-                [elem.get('ingredient_id') for elem in elems])) else False)(
-            value):
+        ids = {elem.get('ingredient_id') for elem in value}
+        if len(value) != len(ids):
             errors.append('Набор ингредиентов должен быть уникальным')
+        if ids - set(Ingredient.objects.filter(
+                id__in=ids).values_list('id', flat=True)):
+            errors.append('Нет такого ингридиента')
         if errors:
             raise serializers.ValidationError(errors)
         return value
@@ -133,8 +174,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         errors = []
         if not value:
             errors.append('Необходимо выбрать тег')
-        if not (lambda elems: True
-        if len(elems) == len(set(elems)) else False)(value):
+        if len(value) != len(set(value)):
             errors.append('Набор тегов должен быть уникальным')
         if errors:
             raise serializers.ValidationError(errors)
@@ -148,41 +188,87 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return value
 
     @staticmethod
-    def set_ingredients(instance, ingredients):
-        instance.ingredients.bulk_create([
-            IngredientInRecipe(recipe=instance, **ingredient)
-            for ingredient in ingredients])
+    def set_ingredients(recipe, ingredients, old_amounts):
+        """ Приводит ингредиенты рецепта к новому набору, меняя только
+        отличающиеся строки. Возвращает новые количества. """
+        new_amounts = {ingredient['ingredient_id']: ingredient['amount']
+                       for ingredient in ingredients}
+        removed = old_amounts.keys() - new_amounts.keys()
+        changed = {ingredient: amount
+                   for ingredient, amount in new_amounts.items()
+                   if old_amounts.get(ingredient, amount) != amount}
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        if changed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=changed).update(
+                amount=Case(*(When(ingredient_id=ingredient, then=amount)
+                              for ingredient, amount in changed.items())))
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe=recipe, ingredient_id=ingredient,
+                               amount=amount)
+            for ingredient, amount in new_amounts.items()
+            if ingredient not in old_amounts])
+        return new_amounts
 
+    @staticmethod
+    def set_tags(recipe, tags, old_tags=()):
+        """ Добавляет недостающие и удаляет лишние теги рецепта. """
+        new_tags = {tag.id for tag in tags}
+        old_tags = set(old_tags)
+        removed = old_tags - new_tags
+        if removed:
+            TagOfRecipes.objects.filter(
+                recipe=recipe, tag_id__in=removed).delete()
+        TagOfRecipes.objects.bulk_create([
+            TagOfRecipes(recipe=recipe, tag_id=tag)
+            for tag in new_tags - old_tags])
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(
             **validated_data,
             author=self.context.get('request').user)
-        self.set_ingredients(recipe, ingredients)
-        for tag in tags:
-            TagOfRecipes.objects.create(recipe=recipe, tag=tag)
+        self.set_ingredients(recipe, ingredients, {})
+        self.set_tags(recipe, tags)
+        transaction.on_commit(
+            lambda: schedule_renditions(recipe.pk, recipe.image.name))
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         if 'tags' in validated_data:
-            instance.tags.set(validated_data.pop('tags'))
+            self.set_tags(
+                instance, validated_data.pop('tags'),
+                TagOfRecipes.objects.filter(recipe=instance).values_list(
+                    'tag_id', flat=True))
         if 'ingredients' in validated_data:
-            instance.ingredients.all().delete()
-            self.set_ingredients(instance, validated_data.pop('ingredients'))
+            old_amounts = ShoppingCartItem.objects.get_amounts(instance)
+            new_amounts = self.set_ingredients(
+                instance, validated_data.pop('ingredients'), old_amounts)
+            if new_amounts != old_amounts:
+                ShoppingCartItem.objects.change_recipe(
+                    instance, old_amounts, new_amounts)
+        if 'image' in validated_data:
+            instance.has_renditions = False
+            transaction.on_commit(
+                lambda: schedule_renditions(instance.pk, instance.image.name))
         return super().update(instance, validated_data)
 
 
 class RecipeForUserSerializer(serializers.ModelSerializer):
+    images = ImageRenditionsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
 
 
 class SubscriptionsSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
-    is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
@@ -190,85 +276,92 @@ class SubscriptionsSerializer(UserSerializer):
         model = User
 
     def get_recipes(self, obj):
+        recipes = getattr(obj, 'first_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.order_by('id')[:self.context.get(
+                'recipes_limit')]
         return RecipeForUserSerializer(
-            obj.recipes.order_by('id')[:self.context.get(
-                'recipes_limit')],
-            many=True, read_only=True).data
-
-    @staticmethod
-    def get_recipes_count(user):
-        return user.recipes.count()
+            recipes, many=True, read_only=True).data
 
-    def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return (request and request.user.is_authenticated
-                and request.user.followers.filter(user=obj).exists())
 
-
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    recipe_id = serializers.IntegerField()
+class UserRecipeRelationSerializer(serializers.ModelSerializer):
+    """ Общий сериализатор избранного и корзины. Рецепт загружается при
+    валидации и используется в ответе, а повтор ловится по уникальному
+    ограничению, а не отдельным запросом. """
+    recipe_id = serializers.PrimaryKeyRelatedField(
+        source='recipe', queryset=Recipe.objects.all())
     user_id = serializers.IntegerField()
+    already_exists = None
 
     class Meta:
-        model = Basket
         fields = ('recipe_id', 'user_id')
 
-    def validate(self, attrs):
-        if Basket.objects.filter(user_id=attrs['user_id'],
-                                 recipe_id=attrs['recipe_id']).exists():
-            raise serializers.ValidationError(
-                'Рецепт уже есть в корзине у данного пользователя')
-        return attrs
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(self.already_exists)
 
     def to_representation(self, instance):
-        return RecipeForUserSerializer(instance.recipe,
-                                       context={
-                                           'user': instance.user}).data
+        return RecipeForUserSerializer(instance.recipe).data
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    recipe_id = serializers.IntegerField()
-    user_id = serializers.IntegerField()
+class ShoppingCartSerializer(UserRecipeRelationSerializer):
+    already_exists = 'Рецепт уже есть в корзине у данного пользователя'
 
-    class Meta:
+    class Meta(UserRecipeRelationSerializer.Meta):
+        model = Basket
+
+    def create(self, validated_data):
+        basket = super().create(validated_data)
+        ShoppingCartItem.objects.add_recipe(
+            self.context.get('request').user, basket.recipe)
+        return basket
+
+
+class FavoriteSerializer(UserRecipeRelationSerializer):
+    already_exists = 'Рецепт уже есть в избранном у данного пользователя'
+
+    class Meta(UserRecipeRelationSerializer.Meta):
         model = Favorite
-        fields = ('recipe_id', 'user_id')
 
-    def validate(self, attrs):
-        if Favorite.objects.filter(user_id=attrs['user_id'],
-                                   recipe_id=attrs['recipe_id']).exists():
-            raise serializers.ValidationError(
-                'Рецепт уже есть в избранном у данного пользователя')
-        return attrs
 
-    def to_representation(self, instance):
-        return RecipeForUserSerializer(instance.recipe,
-                                       context={
-                                           'user': instance.user}).data
+class RecipeIdsSerializer(serializers.Serializer):
+    """ Список рецептов для массового добавления в избранное или корзину.
+    """
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False,
+        max_length=settings.MAX_BULK_RECIPES)
+
+    @staticmethod
+    def validate_recipes(value):
+        recipes = Recipe.objects.in_bulk(value)
+        missing = set(value) - recipes.keys()
+        if missing:
+            raise serializers.ValidationError(
+                f'Нет рецептов с id {", ".join(map(str, sorted(missing)))}')
+        return list(recipes.values())
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
-    author_id = serializers.IntegerField()
+    author_id = serializers.PrimaryKeyRelatedField(
+        source='author', queryset=User.objects.all(),
+        error_messages={'does_not_exist': 'Нет такого пользователя'})
     user_id = serializers.IntegerField()
 
     class Meta:
         model = Subscribe
         fields = ('author_id', 'user_id')
 
-    @staticmethod
-    def validate_author_id(value):
-        if not User.objects.filter(pk=value).exists():
-            raise serializers.ValidationError('Нет такого пользователя')
-        return value
-
-    def validate(self, attrs):
-        if Subscribe.objects.filter(user_id=attrs['user_id'],
-                                    author_id=attrs['author_id']).exists():
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
             raise serializers.ValidationError(
                 'Подписка уже есть у данного пользователя')
-        return attrs
 
     def to_representation(self, instance):
         return SubscriptionsSerializer(instance.author,
-                                       context={
-                                           'user': instance.user}).data
+                                       context=self.context).data
@@ -1,8 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (IngredientsViewSet, RecipeViewSet, SubscribeView,
-                    SubscriptionsViewSet, TagViewSet)
+from .views import (IngredientsViewSet, RecipeViewSet, ResponseCacheStatsView,
+                    SubscribeView, SubscriptionsViewSet, TagViewSet)
 
 app_name = 'api'
 
@@ -20,6 +20,8 @@ urlpatterns = [
     path('', include(router_v1.urls)),
     path('auth/', include('djoser.urls.authtoken')),
     path('', include('djoser.urls')),
+    path('cache/stats/', ResponseCacheStatsView.as_view(),
+         name='cache-stats'),
     path('users/<int:user_id>/subscribe/',
          SubscribeView.as_view(), name='subscribe'),
 ]
@@ -1,129 +1,278 @@
 import re
 
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.http import Http404, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
+from recipe.cache import bump_version, get_user_state_namespace
+from recipe.counters import change_counter
+from recipe.feed import get_feed_ids
+from recipe.models import (Basket, Favorite, Ingredient, Recipe,
+                           ShoppingCartItem, Tag)
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.filters import OrderingFilter, SearchFilter
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
+from users.models import Subscribe, User, lock_user
 
-from recipe.models import Basket, Favorite, Ingredient, Recipe, Tag
-from users.models import Subscribe, User
-from .filters import RecipeFilter
+from .autocomplete import ingredient_index
+from .caching import (AnonymousCacheMixin, CachedListMixin,
+                      ConditionalRecipeMixin)
+from .documents import RecipeReadSerializer, build_documents
+from .filters import RecipeFilter, RecipeOrderingFilter, RecipeSearchFilter
+from .pagination import RecipePagination
+from .parsers import LimitedJSONParser
+from .renderers import (CSVRenderer, PlainTextRenderer,
+                        ShoppingCartJSONRenderer, buffered)
 from .serializers import (FavoriteSerializer, IngredientSerializer,
-                          RecipeCreateSerializer, RecipeSerializer,
+                          RecipeCreateSerializer, RecipeForUserSerializer,
+                          RecipeIdsSerializer, RecipeSerializer,
                           ShoppingCartSerializer, SubscribeSerializer,
                           SubscriptionsSerializer, TagSerializer)
 
+# Сколько строк списка покупок читается из курсора БД за раз
+SHOPPING_CART_CHUNK_SIZE = 500
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.filter()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    cache_namespace = 'tags'
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
-    filter_backends = [SearchFilter]
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
-    search_fields = ('^name', '$name')
+    cache_namespace = 'ingredients'
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(api_settings.SEARCH_PARAM)
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get('limit', '')
+        return Response(ingredient_index.search(
+            name, int(limit) if re.fullmatch(r"^\d+$", limit) else None))
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    filter_backends = (DjangoFilterBackend, OrderingFilter)
+class RecipeViewSet(ConditionalRecipeMixin, AnonymousCacheMixin,
+                    viewsets.ModelViewSet):
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter,
+                       RecipeSearchFilter)
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
+    parser_classes = (LimitedJSONParser, FormParser, MultiPartParser)
     permission_classes = (AllowAny,)
     queryset = Recipe.objects.all()
     ordering = ('id',)
     http_method_names = ['get', 'post', 'patch', 'delete']
 
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            return Recipe.objects.with_documents(self.request.user)
+        return super().get_queryset()
+
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update'):
             return RecipeCreateSerializer
+        if self.action in ('list', 'retrieve'):
+            return RecipeReadSerializer
         return RecipeSerializer
 
+    @transaction.atomic
+    def perform_create(self, serializer):
+        serializer.save()
+        build_documents([serializer.instance.pk])
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+        build_documents([serializer.instance.pk])
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        ShoppingCartItem.objects.delete_recipe(instance)
+        # Рецепт, уже удаленный параллельным запросом, дает 404 и откат
+        # списков покупок и счетчиков, как в shopping_cart_delete
+        _, deleted = Recipe.objects.filter(pk=instance.pk).delete()
+        if not deleted.get(Recipe._meta.label):
+            raise Http404
+
     @staticmethod
     def obj_create(serializer, request, pk):
+        lock_user(request.user)
         serializer = serializer(data={'recipe_id': pk,
-                                      'user_id': request.user.pk})
+                                      'user_id': request.user.pk},
+                                context={'request': request})
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
-    def send_file(ingredients):
-        text = ('shopping cart is empty' if not ingredients else
-                '\n'.join([
-                    (f'{obj.get("recipe__ingredients__ingredient__name")}: '
-                     f'{obj.get("recipe__ingredients__amount__sum")}')
-                    for obj in ingredients]))
-        response = HttpResponse(text, content_type='text/plain')
+    def bulk_create(model, counter, request):
+        """ Добавляет пользователю рецепты списком, пропуская уже
+        добавленные. Возвращает добавленные рецепты. """
+        lock_user(request.user)
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data['recipes']
+        existing = set(model.objects.filter(
+            user=request.user, recipe__in=recipes
+        ).values_list('recipe_id', flat=True))
+        added = [recipe for recipe in recipes if recipe.pk not in existing]
+        model.objects.bulk_create(
+            [model(user=request.user, recipe=recipe) for recipe in added],
+            ignore_conflicts=True)
+        change_counter(Recipe, counter, [recipe.pk for recipe in added], 1)
+        namespace = get_user_state_namespace(request.user.pk)
+        transaction.on_commit(lambda: bump_version(namespace))
+        return added
+
+    @staticmethod
+    def bulk_response(added):
+        return Response(
+            RecipeForUserSerializer(added, many=True).data,
+            status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def send_file(rows, renderer):
+        response = StreamingHttpResponse(
+            buffered(renderer.stream(rows)),
+            content_type=f'{renderer.media_type}; charset=utf-8')
         response['Content-Disposition'] = (
-            'attachment; filename=foodgram_shopping_cart.txt')
+            f'attachment; filename=foodgram_shopping_cart.{renderer.format}')
         return response
 
     @action(detail=False, methods=['get'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            renderer_classes=(PlainTextRenderer, CSVRenderer,
+                              ShoppingCartJSONRenderer))
     def download_shopping_cart(self, request):
-        ingredients = request.user.baskets.prefetch_related(
-            'recipe').values(
-            'recipe__ingredients__ingredient__name').annotate(
-            Sum('recipe__ingredients__amount')).order_by(
-            'recipe__ingredients__ingredient__name')
-        return self.send_file(ingredients)
+        rows = request.user.shopping_cart.values(
+            'amount',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit')
+        ).order_by('name', 'measurement_unit')
+        return self.send_file(
+            rows.iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE),
+            request.accepted_renderer)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """ Рецепты авторов, на которых подписан пользователь, от новых к
+        старым. Следующая страница запрашивается по ?before=<id>. """
+        before = request.query_params.get('before', '')
+        before = int(before) if re.fullmatch(r"^\d+$", before) else None
+        limit = request.query_params.get('limit', '')
+        limit = min(int(limit), settings.FEED_MAX_PAGE_SIZE) if re.fullmatch(
+            r"^[1-9]\d*$", limit) else api_settings.PAGE_SIZE
+        ids = get_feed_ids(request.user, before, limit + 1)
+        recipes = Recipe.objects.with_documents(request.user).filter(
+            pk__in=ids[:limit]).order_by('-id')
+        next_url = None
+        if len(ids) > limit:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), 'before', ids[limit - 1])
+        return Response({
+            'next': next_url,
+            'results': RecipeReadSerializer(recipes, many=True).data})
 
     @action(detail=True, methods=['post'],
             permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def shopping_cart(self, request, pk):
         return self.obj_create(ShoppingCartSerializer, request, pk)
 
     @shopping_cart.mapping.delete
+    @transaction.atomic
     def shopping_cart_delete(self, request, pk):
-        get_object_or_404(Basket, recipe_id=pk, user_id=request.user.pk
-                          ).delete()
+        # Сигнал post_delete уменьшает счетчики и для строки, которую уже
+        # удалил параллельный запрос, поэтому без удаленных строк ответ 404
+        # откатывает транзакцию вместе с ними
+        deleted, _ = Basket.objects.filter(
+            recipe_id=pk, user_id=request.user.pk).delete()
+        if not deleted:
+            raise Http404
+        ShoppingCartItem.objects.remove_recipe(request.user, pk)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['post'], url_path='shopping_cart',
+            permission_classes=[IsAuthenticated])
+    @transaction.atomic
+    def shopping_cart_bulk(self, request):
+        added = self.bulk_create(Basket, 'basket_count', request)
+        ShoppingCartItem.objects.add_recipes(request.user, added)
+        return self.bulk_response(added)
+
     @action(detail=True, methods=['post'],
             permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def favorite(self, request, pk):
         return self.obj_create(FavoriteSerializer, request, pk)
 
     @favorite.mapping.delete
+    @transaction.atomic
     def favorite_delete(self, request, pk):
-        get_object_or_404(Favorite, recipe_id=pk, user_id=request.user.pk
-                          ).delete()
+        deleted, _ = Favorite.objects.filter(
+            recipe_id=pk, user_id=request.user.pk).delete()
+        if not deleted:
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['post'], url_path='favorite',
+            permission_classes=[IsAuthenticated])
+    @transaction.atomic
+    def favorite_bulk(self, request):
+        return self.bulk_response(
+            self.bulk_create(Favorite, 'favorites_count', request))
+
 
 class SubscriptionsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     serializer_class = SubscriptionsSerializer
     filter_backends = (DjangoFilterBackend,)
 
     def get_queryset(self):
-        return User.objects.filter(followers__user=self.request.user)
+        return User.objects.filter(
+            followers__user=self.request.user
+        ).annotate(
+            is_subscribed=Exists(Subscribe.objects.filter(
+                user=self.request.user, author=OuterRef('pk'))))
+
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit', '')
+        return int(recipes_limit) if re.fullmatch(
+            r"^\d+$", recipes_limit) else None
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['recipes_limit'] = self.get_recipes_limit()
+        return context
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
 
         page = self.paginate_queryset(queryset)
+        authors = list(queryset) if page is None else page
+
+        recipes = {author.pk: [] for author in authors}
+        for recipe in Recipe.objects.first_of_authors(
+                authors, self.get_recipes_limit()):
+            recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.first_recipes = recipes[author.pk]
 
+        serializer = self.get_serializer(authors, many=True)
         if page is not None:
-            serializer = self.get_serializer(page, many=True, context={
-                'user': request.user,
-                'recipes_limit': (
-                    lambda obj: int(obj)
-                    if re.fullmatch(r"^\d+$", obj) else None)(
-                    request.query_params.get('recipes_limit', ''))})
             return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
 
@@ -133,13 +282,25 @@ class SubscribeView(APIView):
     def post(request, user_id):
         serializer = SubscribeSerializer(data={
             'author_id': user_id,
-            'user_id': request.user.pk})
+            'user_id': request.user.pk}, context={'request': request})
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
+    @transaction.atomic
     def delete(request, user_id):
-        get_object_or_404(Subscribe, author_id=user_id, user_id=request.user.pk
-                          ).delete()
+        deleted, _ = Subscribe.objects.filter(
+            author_id=user_id, user_id=request.user.pk).delete()
+        if not deleted:
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ResponseCacheStatsView(APIView):
+    """ Счетчики кэша ответов для анонимов. """
+    permission_classes = (IsAdminUser,)
+
+    @staticmethod
+    def get(request):
+        return Response(RecipeViewSet.response_cache_stats.get())
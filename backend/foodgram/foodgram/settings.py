@@ -28,15 +28,20 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',
     'users.apps.UsersConfig',
     'recipe.apps.RecipeConfig',
+    'perf.apps.PerfConfig',
 ]
 
 MIDDLEWARE = [
+    'perf.middleware.ServerTimingMiddleware',
+    'perf.middleware.NPlusOneMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # После AuthenticationMiddleware, чтобы узнавать сотрудника и по сессии
+    'perf.middleware.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -132,6 +137,9 @@ REST_FRAMEWORK = {
     'SEARCH_PARAM': 'name',
 }
 
+# Наибольший размер страницы рецептов, запрошенный параметром limit
+RECIPES_MAX_PAGE_SIZE = 100
+
 DJOSER = {
     'SEND_CONFIRMATION_EMAIL': False,
     'SERIALIZERS': {
@@ -153,3 +161,107 @@ CORS_URLS_REGEX = r'^/api/.*$'
 MAX_LENGTH_FOR_FIELDS_OF_MODELS = 200
 MAX_LENGTH_FOR_EMAIL_OF_MODELS = 254
 MAX_LENGTH_FOR_NAME_OF_MODELS = 150
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    },
+    # Готовые ответы API для анонимных пользователей и версии данных, по
+    # которым они сбрасываются. Если процессов сервера несколько, кэш должен
+    # быть общим для них, например memcached
+    'responses': {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION', default='foodgram-responses'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('RESPONSE_CACHE_MAX_ENTRIES', default=1000)),
+        },
+    },
+}
+
+# Сколько секунд хранятся версии и готовые ответы справочников (теги,
+# ингредиенты). При локальном кэше в каждом процессе это же время
+# ограничивает задержку, с которой процесс увидит чужие изменения.
+REFERENCE_CACHE_TIMEOUT = int(
+    os.getenv('REFERENCE_CACHE_TIMEOUT', default=300))
+REFERENCE_CACHE_MAX_AGE = int(
+    os.getenv('REFERENCE_CACHE_MAX_AGE', default=60))
+
+# Сколько секунд хранится ответ для анонимов. Изменения рецептов, авторов,
+# тегов и ингредиентов сбрасывают его сразу, а новые избранное и корзины,
+# влияющие на сортировку по популярности, - только по истечении времени.
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=60))
+# Сколько секунд остальные запросы ждут ответ, который строит первый
+RESPONSE_CACHE_LOCK_TIMEOUT = 5
+
+# Конфигурация полнотекстового поиска рецептов в PostgreSQL
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', default='russian')
+
+# Уменьшенные копии картинок рецептов: имя -> максимальные ширина и высота
+IMAGE_RENDITIONS = {
+    'thumbnail': (200, 200),
+    'card': (600, 600),
+    'full': (1600, 1600),
+}
+IMAGE_RENDITION_FORMAT = 'WEBP'
+IMAGE_RENDITION_QUALITY = 80
+# Процессы для обработки картинок, 0 - обрабатывать прямо в запросе
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=1))
+
+# Ограничения загружаемых картинок рецептов
+MAX_IMAGE_UPLOAD_SIZE = int(
+    os.getenv('MAX_IMAGE_UPLOAD_SIZE', default=10 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', default=40_000_000))
+# Тело JSON запроса с картинкой в base64 (примерно на треть больше файла)
+MAX_JSON_BODY_SIZE = MAX_IMAGE_UPLOAD_SIZE * 4 // 3 + 1024 * 1024
+# Файлы из multipart запросов сразу пишутся во временный файл на диске,
+# откуда хранилище их переносит, не держа содержимое в памяти
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Сколько рецептов можно добавить в избранное или корзину одним запросом
+MAX_BULK_RECIPES = int(os.getenv('MAX_BULK_RECIPES', default=100))
+
+# Вес счетчиков рецепта в его популярности. После изменения популярность
+# пересчитывается командой check_counters --repair
+POPULARITY_WEIGHTS = {'favorites_count': 2, 'basket_count': 1}
+
+# Лента подписок: рецепты авторов, у которых подписчиков не больше
+# FEED_FANOUT_LIMIT, раскладываются по лентам при публикации, остальные
+# читаются при запросе ленты
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=1000))
+FEED_BATCH_SIZE = 1000
+# Сколько последних рецептов автора попадает в ленту при подписке
+FEED_BACKFILL = 50
+FEED_MAX_PAGE_SIZE = 50
+
+# Измерение запросов: заголовок Server-Timing и метрики на /metrics
+PERF_SERVER_TIMING = os.getenv('PERF_SERVER_TIMING', default='1') == '1'
+PERF_DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PERF_QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+# Без токена метрики видны только сотрудникам
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
+# Поиск N+1: запрос, повторенный в одном запросе к API больше
+# NPLUSONE_THRESHOLD раз, пишется в журнал (warn) или вызывает ошибку
+# (raise, для тестов). off - проверка выключена
+NPLUSONE_MODE = os.getenv(
+    'NPLUSONE_MODE', default='warn' if DEBUG else 'off')
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', default=5))
+
+# Профилирование запросов сотрудников по заголовку X-Profile или параметру
+# _profile. Хранятся только PROFILE_MAX_COUNT последних профилей
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile'
+PROFILE_DIR = os.getenv('PROFILE_DIR', default=os.path.join(
+    BASE_DIR, 'profiles'))
+PROFILE_MAX_COUNT = int(os.getenv('PROFILE_MAX_COUNT', default=50))
+PROFILE_SUMMARY_LIMIT = 30
@@ -0,0 +1,18 @@
+from django.contrib import admin
+
+from .models import Profile
+
+
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    """ Класс для просмотра профилей запросов в админке. """
+    list_display = ('created', 'user', 'method', 'path', 'status',
+                    'duration', 'queries', 'db_duration')
+    list_filter = ('method', 'status')
+    search_fields = ('path',)
+    readonly_fields = ('created', 'user', 'method', 'path', 'status',
+                       'duration', 'queries', 'db_duration', 'file',
+                       'summary')
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class PerfConfig(AppConfig):
+    name = 'perf'
+    verbose_name = 'Производительность'
+
+    def ready(self):
+        from rest_framework.serializers import BaseSerializer
+
+        from .middleware import timed_data
+
+        # Serializer и ListSerializer вызывают data базового класса
+        BaseSerializer.data = timed_data(BaseSerializer.data)
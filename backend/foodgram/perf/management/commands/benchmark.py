@@ -0,0 +1,166 @@
+import io
+import json
+import time
+
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from perf.metrics import percentile
+from perf.middleware import QueryTimer
+from recipe.models import Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from users.models import Subscribe
+
+
+def get_scenarios():
+    """ Основные запросы API на данных, созданных generate_data. """
+    user, author = Subscribe.objects.order_by('pk').values_list(
+        'user_id', 'author_id').first()
+    recipe = Recipe.objects.order_by('pk').first()
+    word = recipe.name.split()[0]
+    ingredient = Ingredient.objects.order_by('pk').first().name[:3]
+    return user, (
+        ('recipes', '/api/recipes/'),
+        ('recipes_tags', f'/api/recipes/?tags={Tag.objects.first().slug}'),
+        ('recipes_author', f'/api/recipes/?author={author}'),
+        ('recipes_favorited', '/api/recipes/?is_favorited=1'),
+        ('recipes_in_cart', '/api/recipes/?is_in_shopping_cart=1'),
+        ('recipes_cooking_time', '/api/recipes/?cooking_time_max=30'),
+        ('recipes_popular', '/api/recipes/?ordering=popularity'),
+        ('recipes_search', f'/api/recipes/?search={word}'),
+        ('recipe_detail', f'/api/recipes/{recipe.pk}/'),
+        ('feed', '/api/recipes/feed/'),
+        ('subscriptions', '/api/users/subscriptions/'),
+        ('download_shopping_cart', '/api/recipes/download_shopping_cart/'),
+        ('ingredients_search', f'/api/ingredients/?name={ingredient}'),
+    )
+
+
+def fetch(client, url):
+    """ Ответ вместе с телом: потоковый ответ формируется и обращается к
+    БД только при чтении тела. """
+    response = client.get(url)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def measure(client, url, repeat):
+    """ Число запросов к БД и задержка ответа в мс. """
+    fetch(client, url)
+    durations = []
+    for _ in range(repeat):
+        timer = QueryTimer()
+        with connection.execute_wrapper(timer):
+            start = time.perf_counter()
+            response = fetch(client, url)
+            durations.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+    return {'queries': timer.queries,
+            'p50_ms': round(percentile(durations, 50), 2),
+            'p99_ms': round(percentile(durations, 99), 2)}
+
+
+def find_query_growth(results):
+    """ Сценарии, число запросов которых растет вместе с данными. """
+    sizes = [results[size] for size in sorted(results, key=int)]
+    return [
+        f'{name}: число запросов растет с объемом данных '
+        f'({sizes[0][name]["queries"]} -> {sizes[-1][name]["queries"]})'
+        for name in sizes[0]
+        if sizes[-1][name]['queries'] > sizes[0][name]['queries']]
+
+
+def find_regressions(results, baseline, tolerance):
+    """ Сценарии, ставшие медленнее базового прогона больше чем на
+    tolerance, или выполняющие больше запросов. """
+    regressions = []
+    for size, scenarios in results.items():
+        for name, current in scenarios.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            if current['queries'] > base['queries']:
+                regressions.append(
+                    f'{size}/{name}: запросов {base["queries"]} -> '
+                    f'{current["queries"]}')
+            for metric in ('p50_ms', 'p99_ms'):
+                if current[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(
+                        f'{size}/{name}: {metric} {base[metric]} -> '
+                        f'{current[metric]}')
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ("Замеряет число запросов к БД и задержку основных запросов API "
+            "на синтетических данных нескольких объемов во временной БД")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=(1000, 10000),
+            help='Количество рецептов в замерах, по возрастанию')
+        parser.add_argument(
+            '--repeat', type=int, default=30,
+            help='Количество повторов каждого запроса')
+        parser.add_argument(
+            '--output', default='benchmark.json',
+            help='Файл для результатов в JSON')
+        parser.add_argument(
+            '--compare',
+            help='Файл результатов прошлого прогона для сравнения')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост задержки относительно прошлого прогона')
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять временную БД с данными после замеров')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)['sizes']
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+        with open(options['output'], 'w') as file:
+            json.dump({'database': connection.vendor,
+                       'repeat': options['repeat'], 'sizes': results},
+                      file, ensure_ascii=False, indent=2)
+        problems = find_query_growth(results)
+        if baseline is not None:
+            problems += find_regressions(
+                results, baseline, options['tolerance'])
+        if problems:
+            raise CommandError('\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты записаны в {options["output"]}'))
+
+    def run(self, options):
+        results = {}
+        for size in sorted(options['sizes']):
+            missing = size - Recipe.objects.count()
+            if missing > 0:
+                self.stdout.write(f'Создание данных до {size} рецептов...')
+                call_command(
+                    'generate_data', recipes=missing,
+                    users=max(missing // 10, 10), stdout=io.StringIO())
+            user, scenarios = get_scenarios()
+            client = Client(HTTP_AUTHORIZATION=(
+                f'Token {Token.objects.get_or_create(user_id=user)[0].key}'))
+            results[str(size)] = {}
+            for name, url in scenarios:
+                results[str(size)][name] = measure(
+                    client, url, options['repeat'])
+                self.stdout.write(f'  {size} {name}: '
+                                  f'{results[str(size)][name]}')
+        return results
@@ -0,0 +1,199 @@
+import io
+import random
+import time
+import uuid
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image
+from recipe.cache import bump_version
+from recipe.models import (Basket, Favorite, Ingredient, IngredientInRecipe,
+                           Recipe, Tag, TagOfRecipes)
+from users.models import Subscribe, User
+
+WORDS = ('картофель', 'морковь', 'лук', 'чеснок', 'томат', 'огурец',
+         'перец', 'курица', 'говядина', 'свинина', 'рыба', 'рис', 'гречка',
+         'макароны', 'сыр', 'молоко', 'сметана', 'масло', 'яйцо', 'мука',
+         'сахар', 'соль', 'яблоко', 'груша', 'укроп', 'петрушка', 'грибы',
+         'капуста', 'свекла', 'фасоль')
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+TAGS = (('Завтрак', '#E26C2D', 'breakfast'), ('Обед', '#49B64E', 'lunch'),
+        ('Ужин', '#8775D2', 'dinner'))
+# Одна картинка на все синтетические рецепты
+IMAGE = 'recipes/images/synthetic.png'
+
+# Команды, пересчитывающие данные, которые bulk_create обходит вместе с
+# сигналами: счетчики, корзины, поисковый индекс, документы и ленты
+DERIVED = (
+    ('check_counters', {'repair': True}),
+    ('check_shopping_carts', {'repair': True}),
+    ('rebuild_search_index', {}),
+    ('check_recipe_documents', {'repair': True}),
+    ('rebuild_feeds', {}),
+)
+
+
+def get_new_ids(model, last):
+    return list(model.objects.filter(pk__gt=last or 0).order_by(
+        'pk').values_list('pk', flat=True))
+
+
+def get_last_id(model):
+    return model.objects.aggregate(last=Max('pk'))['last']
+
+
+def sample(population, count, exclude=None):
+    """ Случайные элементы без повторов, кроме exclude. """
+    chosen = random.sample(population, min(count + 1, len(population)))
+    return [item for item in chosen if item != exclude][:count]
+
+
+def get_image():
+    if not default_storage.exists(IMAGE):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), '#E26C2D').save(buffer, 'PNG')
+        default_storage.save(IMAGE, ContentFile(buffer.getvalue()))
+    return IMAGE
+
+
+def sentence(length):
+    return ' '.join(random.choice(WORDS) for _ in range(length))
+
+
+class Command(BaseCommand):
+    help = ("Заполняет БД синтетическими пользователями, рецептами и связями "
+            "между ними для проверки производительности")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Количество новых пользователей')
+        parser.add_argument(
+            '--recipes', type=int, default=10000,
+            help='Количество новых рецептов')
+        parser.add_argument(
+            '--ingredients', type=int, default=2000,
+            help='Размер справочника ингредиентов, недостающие создаются')
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help='Количество ингредиентов в рецепте')
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Количество рецептов в избранном нового пользователя')
+        parser.add_argument(
+            '--baskets', type=int, default=5,
+            help='Количество рецептов в корзине нового пользователя')
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Количество подписок нового пользователя')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Количество записей, сохраняемых одной транзакцией')
+        parser.add_argument(
+            '--seed', type=int, default=None,
+            help='Начальное значение генератора случайных чисел')
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help='Не пересчитывать счетчики, индексы, документы и ленты')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = uuid.uuid4().hex[:6]
+        start = time.monotonic()
+
+        tags = self.create_tags()
+        ingredients = self.create_ingredients(options['ingredients'])
+        users = self.create_users(options['users'])
+        authors = users or list(User.objects.values_list('pk', flat=True))
+        if options['recipes'] and not authors:
+            raise CommandError('Нет пользователей, которые станут авторами')
+        recipes = self.create_recipes(options['recipes'], authors)
+        self.insert(IngredientInRecipe, (
+            IngredientInRecipe(recipe_id=recipe, ingredient_id=ingredient,
+                               amount=random.randint(1, 500))
+            for recipe in recipes
+            for ingredient in sample(
+                ingredients, options['ingredients_per_recipe'])))
+        self.insert(TagOfRecipes, (
+            TagOfRecipes(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in sample(tags, random.randint(1, len(tags)))))
+        recipes = recipes or list(Recipe.objects.values_list('pk', flat=True))
+        for model, count in ((Favorite, options['favorites']),
+                             (Basket, options['baskets'])):
+            self.insert(model, (
+                model(user_id=user, recipe_id=recipe)
+                for user in users for recipe in sample(recipes, count)))
+        self.insert(Subscribe, (
+            Subscribe(user_id=user, author_id=author)
+            for user in users
+            for author in sample(authors, options['subscriptions'], user)))
+
+        if not options['skip_derived']:
+            for command, kwargs in DERIVED:
+                self.stdout.write(f'{command}...')
+                step = time.monotonic()
+                call_command(command, stdout=self.stdout, **kwargs)
+                self.stdout.write(f'  {time.monotonic() - step:.1f} с')
+        bump_version('tags', 'ingredients', 'recipes')
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.monotonic() - start:.1f} с'))
+
+    def insert(self, model, objects, **kwargs):
+        """ Сохраняет объекты пачками по batch_size записей. """
+        objects = iter(objects)
+        total = 0
+        start = time.monotonic()
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch, **kwargs)
+            total += len(batch)
+        self.stdout.write(f'  {model._meta.model_name}: {total} '
+                          f'за {time.monotonic() - start:.1f} с')
+
+    def create_tags(self):
+        if not Tag.objects.exists():
+            self.insert(Tag, (
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS), ignore_conflicts=True)
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def create_ingredients(self, count):
+        self.insert(Ingredient, (
+            Ingredient(name=f'{random.choice(WORDS)} {self.prefix}{number}',
+                       measurement_unit=random.choice(UNITS))
+            for number in range(count - Ingredient.objects.count())))
+        return list(Ingredient.objects.values_list('pk', flat=True))
+
+    def create_users(self, count):
+        last = get_last_id(User)
+        # Без пароля: войти под синтетическими пользователями можно по токену
+        password = make_password(None)
+        self.insert(User, (
+            User(username=f'{self.prefix}{number}',
+                 email=f'{self.prefix}{number}@example.com',
+                 first_name=random.choice(WORDS).capitalize(),
+                 last_name=random.choice(WORDS).capitalize(),
+                 password=password)
+            for number in range(count)))
+        return get_new_ids(User, last)
+
+    def create_recipes(self, count, authors):
+        last = get_last_id(Recipe)
+        image = get_image()
+        self.insert(Recipe, (
+            Recipe(author_id=random.choice(authors), image=image,
+                   name=f'{sentence(2).capitalize()} {self.prefix}{number}',
+                   text=sentence(random.randint(10, 40)),
+                   cooking_time=random.randint(1, 180))
+            for number in range(count)))
+        return get_new_ids(Recipe, last)
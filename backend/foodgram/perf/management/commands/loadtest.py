@@ -0,0 +1,231 @@
+import io
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+from perf.metrics import percentile
+from recipe.models import Basket, Favorite, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+# Доли видов запросов в нагрузке по умолчанию
+DEFAULT_MIX = ('recipes_anonymous=70', 'recipes_filtered=10',
+               'favorite_toggle=10', 'download_shopping_cart=10')
+
+
+class Worker:
+    """ Данные одного потока нагрузки: его пользователь и рецепты. """
+
+    def __init__(self, user, recipes, tag):
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        self.favorites = set(Favorite.objects.filter(
+            user=user).values_list('recipe_id', flat=True))
+        self.recipes = recipes
+        self.tag = tag
+
+
+def recipes_anonymous(worker):
+    return 'GET', '/api/recipes/', None, 200
+
+
+def recipes_filtered(worker):
+    return ('GET', f'/api/recipes/?tags={worker.tag}&cooking_time_max=60',
+            worker.token, 200)
+
+
+def favorite_toggle(worker):
+    recipe = random.choice(worker.recipes)
+    path = f'/api/recipes/{recipe}/favorite/'
+    if recipe in worker.favorites:
+        worker.favorites.discard(recipe)
+        return 'DELETE', path, worker.token, 204
+    worker.favorites.add(recipe)
+    return 'POST', path, worker.token, 201
+
+
+def download_shopping_cart(worker):
+    return ('GET', '/api/recipes/download_shopping_cart/', worker.token,
+            200)
+
+
+ACTIONS = {action.__name__: action for action in (
+    recipes_anonymous, recipes_filtered, favorite_toggle,
+    download_shopping_cart)}
+
+
+class WSGITransport:
+    """ Вызывает WSGI приложение проекта в текущем процессе. """
+
+    def __init__(self, host):
+        from foodgram.wsgi import application
+        self.application = application
+        self.host = host
+
+    def __call__(self, method, path, token):
+        path, _, query = path.partition('?')
+        environ = {'REQUEST_METHOD': method, 'PATH_INFO': path,
+                   'QUERY_STRING': query, 'HTTP_HOST': self.host,
+                   'SERVER_NAME': self.host, 'CONTENT_LENGTH': '0',
+                   'wsgi.input': io.BytesIO()}
+        if token:
+            environ['HTTP_AUTHORIZATION'] = f'Token {token}'
+        setup_testing_defaults(environ)
+        statuses = []
+        response = self.application(
+            environ, lambda status, headers, exc_info=None:
+            statuses.append(status))
+        try:
+            for _ in response:
+                pass
+        finally:
+            response.close()
+        return int(statuses[0].split()[0])
+
+
+class HTTPTransport:
+    """ Отправляет запросы запущенному серверу. """
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def __call__(self, method, path, token):
+        request = urllib.request.Request(self.url + path, method=method)
+        if token:
+            request.add_header('Authorization', f'Token {token}')
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+
+def run_worker(worker, transport, names, weights, deadline):
+    """ Отправляет запросы до deadline, возвращает (вид запроса, время,
+    успех) для каждого. """
+    results = []
+    try:
+        while time.monotonic() < deadline:
+            name = random.choices(names, weights)[0]
+            method, path, token, expected = ACTIONS[name](worker)
+            start = time.perf_counter()
+            try:
+                status = transport(method, path, token)
+            except Exception:
+                status = None
+            results.append(
+                (name, time.perf_counter() - start, status == expected))
+    finally:
+        connections.close_all()
+    return results
+
+
+def summarize(results, elapsed):
+    durations = [duration * 1000 for _, duration, _ in results]
+    errors = sum(not ok for _, _, ok in results)
+    return {
+        'requests': len(results),
+        'rps': round(len(results) / elapsed, 1),
+        'error_rate': round(errors / len(results), 4) if results else 0,
+        'p50_ms': round(percentile(durations, 50), 2) if results else 0,
+        'p90_ms': round(percentile(durations, 90), 2) if results else 0,
+        'p99_ms': round(percentile(durations, 99), 2) if results else 0,
+    }
+
+
+class Command(BaseCommand):
+    help = ("Нагружает WSGI приложение проекта в текущем процессе или "
+            "запущенный сервер смесью запросов из нескольких потоков")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mix', nargs='+', default=DEFAULT_MIX,
+            help=f'Доли запросов вида имя=вес, доступны: '
+                 f'{", ".join(ACTIONS)}')
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Количество потоков')
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность нагрузки в секундах')
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного сервера, например http://127.0.0.1:8000,'
+                 ' без него запросы идут в приложение в этом процессе')
+        parser.add_argument(
+            '--host', default='localhost',
+            help='Заголовок Host для запросов в текущем процессе')
+        parser.add_argument(
+            '--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['duration'] <= 0:
+            raise CommandError(
+                '--concurrency и --duration должны быть больше 0')
+        names, weights = self.parse_mix(options['mix'])
+        workers = self.get_workers(options['concurrency'])
+        transport = (HTTPTransport(options['url']) if options['url']
+                     else WSGITransport(options['host']))
+        start = time.monotonic()
+        deadline = start + options['duration']
+        with ThreadPoolExecutor(len(workers)) as executor:
+            futures = [
+                executor.submit(run_worker, worker, transport, names,
+                                weights, deadline)
+                for worker in workers]
+            results = [row for future in futures for row in future.result()]
+        elapsed = time.monotonic() - start
+        report = {'total': summarize(results, elapsed)}
+        for name in names:
+            report[name] = summarize(
+                [row for row in results if row[0] == name], elapsed)
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+
+    @staticmethod
+    def parse_mix(mix):
+        names, weights = [], []
+        for item in mix:
+            name, _, weight = item.partition('=')
+            if name not in ACTIONS or not weight.isdigit():
+                raise CommandError(f'Неизвестная доля запросов: {item}')
+            names.append(name)
+            weights.append(int(weight))
+        return names, weights
+
+    @staticmethod
+    def get_workers(count):
+        """ По своему пользователю с корзиной на поток, чтобы потоки не
+        меняли избранное друг друга. """
+        users = list(User.objects.filter(
+            pk__in=Basket.objects.values('user')).order_by('pk')[:count])
+        recipes = list(Recipe.objects.order_by('-pk').values_list(
+            'pk', flat=True)[:1000])
+        tag = Tag.objects.values_list('slug', flat=True).first()
+        if not users or not recipes or tag is None:
+            raise CommandError(
+                'Нет данных для нагрузки, запустите generate_data')
+        if len(users) < count:
+            raise CommandError(
+                f'Пользователей с корзиной {len(users)}, а потоков {count}: '
+                f'уменьшите --concurrency или создайте больше данных '
+                f'через generate_data')
+        return [Worker(user, recipes, tag) for user in users]
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'{"запросы":<24}{"всего":>8}{"в сек":>9}{"ошибки":>9}'
+            f'{"p50 мс":>9}{"p90 мс":>9}{"p99 мс":>9}')
+        for name, row in report.items():
+            self.stdout.write(
+                f'{name:<24}{row["requests"]:>8}{row["rps"]:>9}'
+                f'{row["error_rate"]:>9.2%}{row["p50_ms"]:>9}'
+                f'{row["p90_ms"]:>9}{row["p99_ms"]:>9}')
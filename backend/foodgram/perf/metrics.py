@@ -0,0 +1,117 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+
+def percentile(values, percent):
+    """ Перцентиль по ближайшему рангу. """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Histogram:
+    """ Гистограмма Prometheus: количество значений по корзинам, их сумма и
+    общее количество. """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+
+    def render(self, name, labels):
+        cumulative = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bucket}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class RouteStats:
+    """ Накопленные измерения запросов к одному маршруту. """
+
+    def __init__(self):
+        self.duration = Histogram(settings.PERF_DURATION_BUCKETS)
+        self.queries = Histogram(settings.PERF_QUERY_BUCKETS)
+        self.db_seconds = 0
+        self.view_seconds = 0
+        self.serialize_seconds = 0
+        self.render_seconds = 0
+        self.responses = defaultdict(int)
+
+
+class Registry:
+    """ Метрики запросов по маршрутам в памяти процесса.
+
+    Запись - несколько сложений под блокировкой, поэтому сбор можно не
+    выключать. Каждый процесс сервера считает свои запросы. """
+    counters = (
+        ('db_seconds', 'Время запросов к БД'),
+        ('view_seconds', 'Время выполнения представления без сериализации'),
+        ('serialize_seconds', 'Время сериализации данных ответа'),
+        ('render_seconds', 'Время отрисовки ответа'),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = defaultdict(RouteStats)
+
+    def record(self, route, method, status, timings):
+        with self.lock:
+            stats = self.routes[route, method]
+            stats.duration.observe(timings.total)
+            stats.queries.observe(timings.queries)
+            stats.db_seconds += timings.db
+            stats.view_seconds += timings.view
+            stats.serialize_seconds += timings.serialize
+            stats.render_seconds += timings.render
+            stats.responses[f'{status // 100}xx'] += 1
+
+    def render(self):
+        """ Метрики в текстовом формате Prometheus. """
+        with self.lock:
+            routes = sorted(self.routes.items())
+            lines = [
+                '# HELP foodgram_request_duration_seconds Время запроса',
+                '# TYPE foodgram_request_duration_seconds histogram']
+            for (route, method), stats in routes:
+                lines.extend(stats.duration.render(
+                    'foodgram_request_duration_seconds',
+                    f'route="{route}",method="{method}"'))
+            lines += [
+                '# HELP foodgram_request_db_queries Запросов к БД за запрос',
+                '# TYPE foodgram_request_db_queries histogram']
+            for (route, method), stats in routes:
+                lines.extend(stats.queries.render(
+                    'foodgram_request_db_queries',
+                    f'route="{route}",method="{method}"'))
+            for counter, description in self.counters:
+                name = f'foodgram_request_{counter}_total'
+                lines += [f'# HELP {name} {description}',
+                          f'# TYPE {name} counter']
+                lines += [
+                    f'{name}{{route="{route}",method="{method}"}} '
+                    f'{getattr(stats, counter)}'
+                    for (route, method), stats in routes]
+            lines += ['# HELP foodgram_responses_total Ответов по статусу',
+                      '# TYPE foodgram_responses_total counter']
+            lines += [
+                f'foodgram_responses_total{{route="{route}",'
+                f'method="{method}",status="{status}"}} {count}'
+                for (route, method), stats in routes
+                for status, count in sorted(stats.responses.items())]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
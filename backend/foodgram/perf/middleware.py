@@ -0,0 +1,170 @@
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import registry
+from .nplusone import detect_n_plus_one
+from .profiler import get_staff_user, is_requested, profile_request
+
+# Измерения запроса, который обрабатывается в текущем потоке
+current_timings = ContextVar('current_timings', default=None)
+
+
+class QueryTimer:
+    """ Обертка выполнения запросов к БД, считающая их число и время. """
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.queries += 1
+
+
+class Timings:
+    """ Измерения одного запроса в секундах. """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_start = self.view_end = self.render_end = None
+        self.timer = QueryTimer()
+        self.total = 0
+        self.serialize = 0
+        self.serializing = False
+
+    @property
+    def queries(self):
+        return self.timer.queries
+
+    @property
+    def db(self):
+        return self.timer.duration
+
+    @property
+    def view(self):
+        """ Время представления без сериализации. """
+        if self.view_start is None:
+            return 0
+        return ((self.view_end or self.start + self.total) - self.view_start
+                - self.serialize)
+
+    @property
+    def render(self):
+        if self.view_end is None or self.render_end is None:
+            return 0
+        return self.render_end - self.view_end
+
+    def header(self):
+        return ', '.join((
+            f'db;desc="{self.queries} queries";dur={self.db * 1000:.1f}',
+            f'view;dur={self.view * 1000:.1f}',
+            f'serialize;dur={self.serialize * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}'))
+
+
+def timed_data(data):
+    """ Оборачивает свойство data сериализаторов DRF так, что время
+    сериализации попадает в измерения текущего запроса. Вложенные вызовы
+    data, например в to_representation, входят во внешний. """
+    @wraps(data.fget)
+    def wrapper(serializer):
+        timings = current_timings.get()
+        if timings is None or timings.serializing:
+            return data.fget(serializer)
+        timings.serializing = True
+        start = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            timings.serialize += time.perf_counter() - start
+            timings.serializing = False
+    return property(wrapper)
+
+
+class ServerTimingMiddleware:
+    """ Измеряет время запроса, представления, сериализации, отрисовки и
+    запросов к БД.
+
+    Измерения отдаются в заголовке Server-Timing и накапливаются по
+    маршрутам для /metrics. Время отдачи потоковых ответов не учитывается.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = request.timings = Timings()
+        token = current_timings.set(timings)
+        with ExitStack() as stack:
+            stack.callback(current_timings.reset, token)
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings.timer))
+            response = self.get_response(request)
+        timings.total = time.perf_counter() - timings.start
+        match = request.resolver_match
+        registry.record(
+            match.url_name if match and match.url_name else 'unmatched',
+            request.method, response.status_code, timings)
+        if settings.PERF_SERVER_TIMING:
+            response['Server-Timing'] = timings.header()
+        return response
+
+    @staticmethod
+    def process_view(request, view_func, view_args, view_kwargs):
+        request.timings.view_start = time.perf_counter()
+
+    @staticmethod
+    def process_template_response(request, response):
+        timings = request.timings
+        timings.view_end = time.perf_counter()
+        response.add_post_render_callback(
+            lambda rendered: setattr(
+                timings, 'render_end', time.perf_counter()))
+        return response
+
+
+class NPlusOneMiddleware:
+    """ Ищет в запросе повторы одного SQL запроса больше
+    NPLUSONE_THRESHOLD раз. В режиме warn пишет их в журнал, в режиме
+    raise ответ завершается ошибкой, в режиме off не подключается. """
+
+    def __init__(self, get_response):
+        if settings.NPLUSONE_MODE == 'off':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with detect_n_plus_one(
+                where=f'{request.method} {request.path}'):
+            return self.get_response(request)
+
+
+class ProfilerMiddleware:
+    """ Профилирует запрос сотрудника, который передал заголовок
+    PROFILE_HEADER или параметр PROFILE_PARAM. Для остальных запросов
+    проверяется только их наличие.
+
+    В профиль попадают представление и middleware после этого. Потоковый
+    ответ профилируется до начала отдачи тела: генератор тела выполняется
+    уже после выхода из middleware и в профиль не попадает. """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if is_requested(request):
+            user = get_staff_user(request)
+            if user is not None:
+                return profile_request(self.get_response, request, user)
+        return self.get_response(request)
@@ -0,0 +1,26 @@
+from django.db import models
+from users.models import User
+
+
+class Profile(models.Model):
+    """ Профиль запроса, снятый по просьбе сотрудника. """
+    created = models.DateTimeField('Дата', auto_now_add=True)
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True,
+        verbose_name='Пользователь')
+    method = models.CharField('Метод', max_length=10)
+    path = models.TextField('Адрес')
+    status = models.PositiveSmallIntegerField('Статус ответа')
+    duration = models.FloatField('Время, мс')
+    queries = models.PositiveIntegerField('Запросов к БД')
+    db_duration = models.FloatField('Время БД, мс')
+    file = models.CharField('Файл профиля', max_length=255)
+    summary = models.TextField('Самые долгие функции и запросы')
+
+    class Meta:
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+        ordering = ('-created',)
+
+    def __str__(self):
+        return f'{self.method} {self.path}'
@@ -0,0 +1,106 @@
+import logging
+import os
+import re
+import sys
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+NORMALIZE = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+)
+# Каталоги, кадры из которых пропускаются при поиске места вызова
+LIBRARY_DIRS = ('site-packages', 'dist-packages', os.path.dirname(__file__))
+
+
+class NPlusOneError(Exception):
+    """ Один и тот же запрос выполнен больше допустимого числа раз. """
+
+
+def fingerprint(sql):
+    """ Запрос без конкретных значений, одинаковый для всех строк. """
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def is_project_file(filename):
+    return (filename.startswith(settings.BASE_DIR)
+            and not any(directory in filename for directory in LIBRARY_DIRS))
+
+
+def get_call_site():
+    """ Ближайшее к запросу место в коде проекта: строка файла проекта или
+    метод объекта класса из проекта, например вложенного сериализатора,
+    вызванный библиотекой. """
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if is_project_file(code.co_filename):
+            filename = os.path.relpath(code.co_filename, settings.BASE_DIR)
+            return f'{filename}:{frame.f_lineno} in {code.co_name}'
+        owner = type(frame.f_locals.get('self'))
+        module = sys.modules.get(owner.__module__)
+        if is_project_file(getattr(module, '__file__', None) or ''):
+            return f'{owner.__module__}.{owner.__qualname__}.{code.co_name}'
+        frame = frame.f_back
+    return 'неизвестно'
+
+
+class QueryRepeats:
+    """ Обертка выполнения запросов, считающая повторы каждого запроса.
+
+    Место вызова ищется один раз, когда запрос превышает порог. """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.counts = {}
+        self.sites = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        key = fingerprint(sql)
+        count = self.counts[key] = self.counts.get(key, 0) + 1
+        if count == self.threshold + 1:
+            self.sites[key] = get_call_site()
+        return execute(sql, params, many, context)
+
+    def get_repeats(self):
+        """ Запросы сверх порога: (количество, запрос, место вызова). """
+        return sorted(
+            ((self.counts[key], key, site)
+             for key, site in self.sites.items()), reverse=True)
+
+
+def report(repeats, mode, where):
+    message = '\n'.join(
+        f'N+1 в {where}: {count} раз из {site}: {sql}'
+        for count, sql, site in repeats)
+    if mode == 'raise':
+        raise NPlusOneError(message)
+    logger.warning(message)
+
+
+@contextmanager
+def detect_n_plus_one(threshold=None, mode=None, where='блоке'):
+    """ Проверяет запросы внутри блока на N+1. По умолчанию порог и режим
+    берутся из NPLUSONE_THRESHOLD и NPLUSONE_MODE, в тестах удобно
+    передать mode='raise'. """
+    mode = mode or settings.NPLUSONE_MODE
+    if mode == 'off':
+        yield None
+        return
+    repeats = QueryRepeats(threshold or settings.NPLUSONE_THRESHOLD)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(repeats))
+        yield repeats
+    found = repeats.get_repeats()
+    if found:
+        report(found, mode, where)
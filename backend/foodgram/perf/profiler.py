@@ -0,0 +1,111 @@
+import cProfile
+import io
+import os
+import pstats
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import Profile
+from .nplusone import fingerprint
+
+
+class QueryLog:
+    """ Обертка выполнения запросов, суммирующая время по видам запросов.
+    """
+
+    def __init__(self):
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            count, duration = self.statements.get(fingerprint(sql), (0, 0))
+            self.statements[fingerprint(sql)] = (
+                count + 1, duration + time.perf_counter() - start)
+
+    @property
+    def queries(self):
+        return sum(count for count, _ in self.statements.values())
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.statements.values())
+
+    def summary(self, limit):
+        lines = [f'{"раз":>5} {"мс":>9}  запрос']
+        for sql, (count, duration) in sorted(
+                self.statements.items(), key=lambda item: -item[1][1]
+        )[:limit]:
+            lines.append(f'{count:>5} {duration * 1000:>9.2f}  {sql}')
+        return '\n'.join(lines)
+
+
+def is_requested(request):
+    return (settings.PROFILE_HEADER in request.META
+            or settings.PROFILE_PARAM in request.GET)
+
+
+def get_staff_user(request):
+    """ Сотрудник, отправивший запрос, по тем же способам входа, что и в
+    API, или None. """
+    try:
+        user = Request(request, authenticators=[
+            authenticator()
+            for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ]).user
+    except APIException:
+        return None
+    return user if user.is_active and user.is_staff else None
+
+
+def remove_old_profiles():
+    """ Оставляет только PROFILE_MAX_COUNT последних профилей. """
+    old = Profile.objects.order_by('-created', '-pk')[
+        settings.PROFILE_MAX_COUNT:]
+    for profile in old:
+        try:
+            os.remove(os.path.join(settings.PROFILE_DIR, profile.file))
+        except FileNotFoundError:
+            pass
+    Profile.objects.filter(pk__in=[profile.pk for profile in old]).delete()
+
+
+def profile_request(get_response, request, user):
+    """ Выполняет запрос под cProfile и сохраняет профиль и сводку.
+
+    Тело потокового ответа здесь не читается, поэтому его формирование и
+    запросы к БД из него в профиль не входят. """
+    profiler = cProfile.Profile()
+    queries = QueryLog()
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(queries))
+        response = profiler.runcall(get_response, request)
+    duration = time.perf_counter() - start
+
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}.prof'
+    profiler.dump_stats(os.path.join(settings.PROFILE_DIR, name))
+    functions = io.StringIO()
+    pstats.Stats(profiler, stream=functions).sort_stats(
+        'cumulative').print_stats(settings.PROFILE_SUMMARY_LIMIT)
+    profile = Profile.objects.create(
+        user=user, method=request.method,
+        path=request.get_full_path()[:2000], status=response.status_code,
+        duration=duration * 1000, queries=queries.queries,
+        db_duration=queries.duration * 1000, file=name,
+        summary=(f'{functions.getvalue().strip()}\n\n'
+                 f'{queries.summary(settings.PROFILE_SUMMARY_LIMIT)}'))
+    remove_old_profiles()
+    response['X-Profile-Id'] = profile.pk
+    return response
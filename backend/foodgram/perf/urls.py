@@ -0,0 +1,9 @@
+from django.urls import path
+
+from .views import metrics
+
+app_name = 'perf'
+
+urlpatterns = [
+    path('metrics', metrics, name='metrics'),
+]
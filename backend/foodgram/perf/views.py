@@ -0,0 +1,22 @@
+from hmac import compare_digest
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .metrics import registry
+from .profiler import get_staff_user
+
+
+def has_metrics_token(request):
+    return bool(settings.METRICS_TOKEN) and compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', ''),
+        f'Bearer {settings.METRICS_TOKEN}')
+
+
+def metrics(request):
+    """ Метрики запросов для Prometheus. Доступны сотрудникам и по токену
+    METRICS_TOKEN в заголовке Authorization: Bearer <токен>. """
+    if not has_metrics_token(request) and get_staff_user(request) is None:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
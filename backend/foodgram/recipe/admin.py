@@ -24,7 +24,7 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = [IngredientInline, TagsInline]
 
     list_display = ('name', 'author', 'get_tags', 'get_ingredients',
-                    'get_quantity_in_favorites')
+                    'favorites_count')
     list_filter = ('name', 'author', 'tags__name')
     search_fields = ('name', 'author')
     empty_value_display = '-пусто-'
@@ -38,12 +38,7 @@ class RecipeAdmin(admin.ModelAdmin):
     def get_tags(obj):
         return ', '.join([tag.name for tag in obj.tags.all()])
 
-    @staticmethod
-    def get_quantity_in_favorites(obj):
-        return obj.favorites.count()
-
     get_tags.short_description = 'Теги'
-    get_quantity_in_favorites.short_description = 'Количество в избранном'
 
 
 @admin.register(Tag)
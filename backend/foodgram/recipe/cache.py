@@ -0,0 +1,63 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+from .models import Tag
+
+# Версии хранятся в кэше ответов: он должен быть общим для процессов
+# сервера и команд управления, чтобы смена версии в одном из них сразу
+# сбрасывала ответы, закэшированные другими
+versions_cache = caches['responses']
+
+
+def get_version_key(namespace):
+    return f'version:{namespace}'
+
+
+def get_version(namespace):
+    """ Текущая версия набора данных.
+
+    Начальная версия берется от времени, чтобы после вытеснения ключа из кэша
+    не повторить уже выданную клиентам версию. """
+    key = get_version_key(namespace)
+    version = versions_cache.get(key)
+    if version is None:
+        versions_cache.add(
+            key, int(time.time() * 1000), settings.REFERENCE_CACHE_TIMEOUT)
+        return versions_cache.get(key)
+    return version
+
+
+def get_versions(namespaces):
+    """ Текущие версии нескольких наборов данных одним запросом к кэшу. """
+    keys = {get_version_key(namespace): namespace for namespace in namespaces}
+    versions = versions_cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        versions[key] = get_version(keys[key])
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def bump_version(*namespaces):
+    """ Сменить версии наборов данных после их изменения. """
+    for namespace in namespaces:
+        try:
+            versions_cache.incr(get_version_key(namespace))
+        except ValueError:
+            get_version(namespace)
+
+
+def get_user_state_namespace(user_id):
+    """ Набор данных пользователя, влияющих на вывод рецептов: избранное,
+    корзина и подписки. """
+    return f'user-state:{user_id}'
+
+
+def get_tag_ids():
+    """ Словарь {slug: id} тегов, закэшированный до смены версии тегов. """
+    key = f'tag-ids:{get_version("tags")}'
+    tags = cache.get(key)
+    if tags is None:
+        tags = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tags, settings.REFERENCE_CACHE_TIMEOUT)
+    return tags
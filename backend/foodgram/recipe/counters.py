@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from users.models import Subscribe, User
+
+from .models import Basket, Favorite, Recipe
+
+# Счетчики: модель, поле счетчика, считаемая модель и ее ссылка на модель
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'basket_count', Basket, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscribe, 'author'),
+)
+
+
+def change_counter(model, counter, pks, delta):
+    """ Атомарно меняет счетчик у объектов с первичными ключами pks, а для
+    счетчиков рецепта заодно и его популярность. """
+    if not pks or not delta:
+        return
+    changes = {counter: F(counter) + delta}
+    weight = settings.POPULARITY_WEIGHTS.get(counter)
+    if weight:
+        changes['popularity'] = F('popularity') + delta * weight
+    model.objects.filter(pk__in=pks).update(**changes)
+
+
+def get_popularity():
+    """ Выражение популярности рецепта из его счетчиков. """
+    return sum((F(counter) * weight for counter, weight
+                in settings.POPULARITY_WEIGHTS.items()), Value(0))
+
+
+def count_related(related, field):
+    """ Выражение с точным значением счетчика для пересчета. """
+    return Coalesce(Subquery(
+        related.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')), 0)
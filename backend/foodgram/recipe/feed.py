@@ -0,0 +1,85 @@
+from django.conf import settings
+from users.models import Subscribe, User
+
+from .models import FeedItem, Recipe
+
+
+def is_fanned_out(author_id):
+    """ Раскладываются ли рецепты автора по лентам подписчиков. Рецепты
+    авторов с большим числом подписчиков лента читает сама. """
+    return User.objects.filter(
+        pk=author_id,
+        followers_count__lte=settings.FEED_FANOUT_LIMIT).exists()
+
+
+def fan_out(recipe):
+    """ Добавляет новый рецепт в ленты подписчиков автора. """
+    if not is_fanned_out(recipe.author_id):
+        return
+    FeedItem.objects.bulk_create([
+        FeedItem(user_id=user, recipe_id=recipe.pk,
+                 author_id=recipe.author_id)
+        for user in Subscribe.objects.filter(
+            author_id=recipe.author_id).values_list('user_id', flat=True)
+    ], batch_size=settings.FEED_BATCH_SIZE, ignore_conflicts=True)
+
+
+def backfill(user_id, author_id):
+    """ Добавляет в ленту последние рецепты автора после подписки. """
+    if not is_fanned_out(author_id):
+        return
+    FeedItem.objects.bulk_create([
+        FeedItem(user_id=user_id, recipe_id=recipe, author_id=author_id)
+        for recipe in Recipe.objects.filter(author_id=author_id).order_by(
+            '-id').values_list('id', flat=True)[:settings.FEED_BACKFILL]
+    ], ignore_conflicts=True)
+
+
+def backfill_followers(author_id):
+    """ Добавляет последние рецепты автора в ленты всех его подписчиков. """
+    recipes = list(Recipe.objects.filter(author_id=author_id).order_by(
+        '-id').values_list('id', flat=True)[:settings.FEED_BACKFILL])
+    FeedItem.objects.bulk_create([
+        FeedItem(user_id=user, recipe_id=recipe, author_id=author_id)
+        for user in Subscribe.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+        for recipe in recipes
+    ], batch_size=settings.FEED_BATCH_SIZE, ignore_conflicts=True)
+
+
+def remove(user_id, author_id):
+    """ Убирает из ленты рецепты автора после отписки.
+
+    Счетчик подписчиков к этому времени уже уменьшен. Если он опустился до
+    FEED_FANOUT_LIMIT, лента перестает читать рецепты автора напрямую, а
+    опубликованные до этого рецепты по лентам не раскладывались, поэтому
+    они добавляются в ленты оставшихся подписчиков. """
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+    if User.objects.filter(
+            pk=author_id,
+            followers_count=settings.FEED_FANOUT_LIMIT).exists():
+        backfill_followers(author_id)
+
+
+def get_feed_ids(user, before=None, limit=10):
+    """ id рецептов ленты по убыванию, меньшие before, не больше limit.
+
+    Разложенные рецепты читаются из ленты пользователя, рецепты авторов с
+    большим числом подписчиков - напрямую, обе выборки идут по индексам и
+    сливаются. """
+    items = FeedItem.objects.filter(user=user)
+    if before is not None:
+        items = items.filter(recipe_id__lt=before)
+    ids = set(items.order_by('-recipe_id').values_list(
+        'recipe_id', flat=True)[:limit])
+    authors = list(Subscribe.objects.filter(
+        user=user,
+        author__followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).values_list('author_id', flat=True))
+    if authors:
+        recipes = Recipe.objects.filter(author_id__in=authors)
+        if before is not None:
+            recipes = recipes.filter(id__lt=before)
+        ids.update(recipes.order_by('-id').values_list(
+            'id', flat=True)[:limit])
+    return sorted(ids, reverse=True)[:limit]
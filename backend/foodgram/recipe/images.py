@@ -0,0 +1,117 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+_executor_lock = threading.Lock()
+
+
+def get_rendition_name(name, rendition):
+    """ Имя файла уменьшенной копии картинки в хранилище. """
+    stem = os.path.splitext(os.path.basename(name))[0]
+    extension = settings.IMAGE_RENDITION_FORMAT.lower()
+    return f'recipes/renditions/{stem}_{rendition}.{extension}'
+
+
+def render(source, targets, image_format, quality):
+    """ Сохраняет уменьшенные копии картинки source.
+
+    Выполняется в отдельном процессе, поэтому работает только с путями
+    файлов и не обращается к Django. targets - список (путь, размер). """
+    with Image.open(source) as image:
+        largest = max(size for path, size in targets)
+        # JPEG декодируется сразу в уменьшенном масштабе
+        image.draft('RGB', largest)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands()
+                                  else 'RGB')
+        for path, size in sorted(targets, key=lambda target: target[1],
+                                 reverse=True):
+            image.thumbnail(size, Image.LANCZOS)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f'{path}.tmp'
+            image.save(temporary, image_format, quality=quality)
+            os.replace(temporary, path)
+
+
+@lru_cache(maxsize=None)
+def create_executor():
+    return ProcessPoolExecutor(
+        max_workers=settings.IMAGE_WORKERS,
+        mp_context=multiprocessing.get_context('spawn'))
+
+
+def get_executor():
+    """ Пул процессов, общий для всех потоков процесса. """
+    with _executor_lock:
+        return create_executor()
+
+
+def mark_ready(recipe_id, name):
+    # Модуль импортируется и в процессах пула, где модели не загружены
+    from .cache import bump_version
+
+    if apps.get_model('recipe', 'Recipe').objects.filter(
+            pk=recipe_id, image=name).update(
+                has_renditions=True, updated=timezone.now()):
+        # Документ рецепта содержит адреса копий и будет построен заново
+        apps.get_model('recipe', 'RecipeDocument').objects.filter(
+            recipe_id=recipe_id).delete()
+        bump_version(f'recipe:{recipe_id}')
+
+
+def on_rendered(recipe_id, name, future):
+    """ Отмечает рецепт, когда копии готовы. Вызывается в служебном потоке
+    пула, поэтому закрывает открытое в нем соединение с БД. """
+    try:
+        future.result()
+        mark_ready(recipe_id, name)
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', name)
+    finally:
+        connections.close_all()
+
+
+def schedule_renditions(recipe_id, name):
+    """ Ставит в очередь создание уменьшенных копий картинки рецепта.
+
+    При IMAGE_WORKERS = 0 копии создаются сразу в текущем процессе. """
+    if not name:
+        return None
+    args = (
+        default_storage.path(name),
+        [(default_storage.path(get_rendition_name(name, rendition)), size)
+         for rendition, size in settings.IMAGE_RENDITIONS.items()],
+        settings.IMAGE_RENDITION_FORMAT,
+        settings.IMAGE_RENDITION_QUALITY)
+    if not settings.IMAGE_WORKERS:
+        render(*args)
+        mark_ready(recipe_id, name)
+        return None
+    future = get_executor().submit(render, *args)
+    future.add_done_callback(
+        lambda done: on_rendered(recipe_id, name, done))
+    return future
+
+
+def get_renditions(recipe):
+    """ Адреса уменьшенных копий, а пока их нет - адрес оригинала. """
+    if not recipe.image:
+        return None
+    return {
+        rendition: default_storage.url(
+            get_rendition_name(recipe.image.name, rendition)
+            if recipe.has_renditions else recipe.image.name)
+        for rendition in settings.IMAGE_RENDITIONS}
@@ -0,0 +1,50 @@
+from django.core.management import BaseCommand
+from django.db.models import F
+from recipe.counters import COUNTERS, count_related, get_popularity
+from recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ("Сверяет счетчики избранного, корзин, рецептов и подписчиков "
+            "с пересчетом по связанным таблицам, а популярность рецептов - "
+            "со счетчиками, и при необходимости исправляет расхождения")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repair', action='store_true',
+            help='Исправить найденные расхождения')
+
+    def handle(self, *args, **options):
+        drift = 0
+        for model, counter, related, field in COUNTERS:
+            actual = count_related(related, field)
+            wrong = model.objects.annotate(actual=actual).exclude(
+                **{counter: F('actual')})
+            found = wrong.count()
+            if not found:
+                continue
+            drift += found
+            self.stdout.write(
+                f'  {model._meta.model_name}.{counter}: '
+                f'расхождений {found}')
+            if options['repair']:
+                model.objects.filter(pk__in=wrong.values('pk')).update(
+                    **{counter: actual})
+        # Популярность сверяется после счетчиков, из которых она считается
+        wrong = Recipe.objects.exclude(popularity=get_popularity())
+        found = wrong.count()
+        if found:
+            drift += found
+            self.stdout.write(f'  recipe.popularity: расхождений {found}')
+            if options['repair']:
+                wrong.update(popularity=get_popularity())
+        if not drift:
+            self.stdout.write(self.style.SUCCESS(
+                'Счетчики совпадают с данными'))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено расхождений: {drift}'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'Найдено расхождений: {drift}, '
+                f'запустите команду с --repair'))
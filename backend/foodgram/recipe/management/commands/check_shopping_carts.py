@@ -0,0 +1,88 @@
+from itertools import islice
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import F, Sum
+from recipe.models import Basket, ShoppingCartItem
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ("Сверяет суммы ингредиентов в списках покупок с полным пересчетом "
+            "по корзинам и при необходимости исправляет расхождения")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repair', action='store_true',
+            help='Исправить найденные расхождения')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Количество пользователей, проверяемых за раз')
+
+    @staticmethod
+    def get_expected(users):
+        """ Суммы ингредиентов, пересчитанные по корзинам. """
+        return {
+            (row['user_id'], row['ingredient_id']): row['total']
+            for row in Basket.objects.filter(
+                user_id__in=users,
+                recipe__ingredients__isnull=False
+            ).values(
+                'user_id', ingredient_id=F('recipe__ingredients__ingredient')
+            ).annotate(total=Sum('recipe__ingredients__amount'))}
+
+    @staticmethod
+    def repair(expected, actual):
+        with transaction.atomic():
+            ShoppingCartItem.objects.filter(pk__in=[
+                item.pk for key, item in actual.items()
+                if key not in expected]).delete()
+            changed = []
+            for key, item in actual.items():
+                if key in expected and item.amount != expected[key]:
+                    item.amount = expected[key]
+                    changed.append(item)
+            ShoppingCartItem.objects.bulk_update(changed, ['amount'])
+            ShoppingCartItem.objects.bulk_create([
+                ShoppingCartItem(user_id=user, ingredient_id=ingredient,
+                                 amount=amount)
+                for (user, ingredient), amount in expected.items()
+                if (user, ingredient) not in actual])
+
+    def check_batch(self, users, repair):
+        expected = self.get_expected(users)
+        actual = {(item.user_id, item.ingredient_id): item
+                  for item in ShoppingCartItem.objects.filter(
+                      user_id__in=users)}
+        drift = [
+            (key, actual[key].amount if key in actual else None,
+             expected.get(key))
+            for key in {*expected, *actual}
+            if key not in actual or expected.get(key) != actual[key].amount]
+        for (user, ingredient), stored, total in sorted(drift):
+            self.stdout.write(
+                f'  пользователь {user}, ингредиент {ingredient}: '
+                f'сохранено {stored}, должно быть {total}')
+        if drift and repair:
+            self.repair(expected, actual)
+        return len(drift)
+
+    def handle(self, *args, **options):
+        drift = 0
+        users = User.objects.order_by('pk').values_list(
+            'pk', flat=True).iterator()
+        while True:
+            batch = list(islice(users, options['batch_size']))
+            if not batch:
+                break
+            drift += self.check_batch(batch, options['repair'])
+        if not drift:
+            self.stdout.write(self.style.SUCCESS(
+                'Списки покупок совпадают с корзинами'))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено расхождений: {drift}'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'Найдено расхождений: {drift}, '
+                f'запустите команду с --repair'))
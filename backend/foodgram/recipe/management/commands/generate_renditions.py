@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+from recipe.images import schedule_renditions
+from recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Создает уменьшенные копии картинок рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать копии и для рецептов, у которых они уже есть')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.filter(has_renditions=False)
+        futures = [
+            schedule_renditions(pk, image)
+            for pk, image in recipes.values_list('pk', 'image').iterator()]
+        for future in futures:
+            if future is not None:
+                future.exception()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {len(futures)}'))
@@ -1,33 +1,171 @@
-from json import load
+import csv
+import json
+import os
+import time
+from itertools import islice
 
-from django.core.management import BaseCommand
-from recipe.models import Ingredient, Tag
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from recipe.cache import bump_version
+from recipe.models import Ingredient, Recipe, Tag
+from recipe.signals import mark_changed
+
+# Фильтр рецептов, в которых используется запись модели
+RECIPE_LOOKUPS = {
+    Ingredient: 'ingredients__ingredient__in',
+    Tag: 'tags__in',
+}
+
+
+def read_csv(file, fields):
+    """ Построчно читает csv файл без заголовка. """
+    for row in csv.reader(file):
+        if row:
+            yield dict(zip(fields, row))
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """ Читает элементы JSON массива по одному, не загружая файл целиком. """
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Файл должен содержать JSON массив')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            row, end = decoder.raw_decode(buffer)
+        except ValueError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise CommandError('Некорректный JSON массив')
+            buffer += chunk
+            continue
+        yield row
+        buffer = buffer[end:]
+
+
+def mark_updated(model, objects):
+    """ bulk_update не отправляет post_save, поэтому рецепты и версии
+    измененных записей обновляются здесь, как в сигналах. """
+    mark_changed(Recipe.objects.filter(**{RECIPE_LOOKUPS[model]: objects}))
+    namespaces = [f'{model._meta.model_name}:{obj.pk}' for obj in objects]
+    transaction.on_commit(lambda: bump_version(*namespaces))
 
 
 class Command(BaseCommand):
-    help = "Команда для загрузки тестовых данных в БД из csv файлов"
+    help = "Команда для загрузки тестовых данных в БД из csv/json файлов"
 
-    # Список переменных для импорта данных в модели
+    # Модель, имя файла, поля в csv и поля, определяющие уникальность записи
     models = (
-        (
-            (Ingredient, 'ingredients'),
-            (Tag, 'tags'),
-        ),
+        (Ingredient, 'ingredients', ('name', 'measurement_unit'),
+         ('name', 'measurement_unit')),
+        (Tag, 'tags', ('name', 'color', 'slug'), ('slug',)),
     )
 
-    def import_data(self):
-        """ Метод импортирует ингредиенты в БД. """
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=os.path.join(settings.BASE_DIR, 'data'),
+            help='Папка с файлами данных')
+        parser.add_argument(
+            '--format', choices=('auto', 'csv', 'json'), default='auto',
+            help='Формат файлов, auto - csv при наличии, иначе json')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество записей, сохраняемых одной транзакцией')
+        parser.add_argument(
+            '--update', action='store_true',
+            help='Обновлять уже существующие записи')
+
+    @staticmethod
+    def get_file(path, name, file_format):
+        """ Возвращает путь и формат файла для импорта. """
+        formats = ('csv', 'json') if file_format == 'auto' else (file_format,)
+        for extension in formats:
+            file = os.path.join(path, f'{name}.{extension}')
+            if os.path.exists(file):
+                return file, extension
+        return None, None
+
+    @staticmethod
+    def save_batch(model, keys, rows, update):
+        """ Сохраняет пачку записей, пропуская или обновляя существующие. """
+        with transaction.atomic():
+            existing = {
+                tuple(getattr(obj, key) for key in keys): obj
+                for obj in model.objects.filter(**{
+                    f'{keys[0]}__in': {row[keys[0]] for row in rows}})}
+            new, changed, seen = [], [], set()
+            for row in rows:
+                key = tuple(row[field] for field in keys)
+                if key in seen:
+                    continue
+                seen.add(key)
+                obj = existing.get(key)
+                if obj is None:
+                    new.append(model(**row))
+                elif update and any(getattr(obj, field) != value
+                                    for field, value in row.items()):
+                    for field, value in row.items():
+                        setattr(obj, field, value)
+                    changed.append(obj)
+            model.objects.bulk_create(new, ignore_conflicts=True)
+            if changed:
+                model.objects.bulk_update(
+                    changed, [field for field in rows[0] if field not in keys])
+                mark_updated(model, changed)
+        return len(new), len(changed)
+
+    def import_file(self, model, file, file_format, fields, keys, options):
+        """ Потоково импортирует файл в модель пачками. """
+        created = updated = total = 0
+        started = time.monotonic()
+        with open(file, encoding='utf-8', newline='') as f:
+            rows = (read_csv(f, fields) if file_format == 'csv'
+                    else read_json(f))
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                new, changed = self.save_batch(
+                    model, keys, batch, options['update'])
+                created += new
+                updated += changed
+                total += len(batch)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'  обработано {total}, добавлено {created}, '
+                    f'обновлено {updated} '
+                    f'({total / max(elapsed, 1e-6):.0f} строк/с)')
+        return created, updated, total
+
+    def import_data(self, options):
+        """ Метод импортирует ингредиенты и теги в БД. """
 
-        for data in self.models:
-            for model, file in data:
-                with open(f'data/{file}.json', encoding='utf-8') as f:
-                    print(f'Начался импорт данных {file}')
-                    for row in load(f):
-                        model.objects.get_or_create(**row)
-                print(f'Импорт данных {file} завершен.')
+        for model, name, fields, keys in self.models:
+            file, file_format = self.get_file(
+                options['path'], name, options['format'])
+            if file is None:
+                self.stderr.write(f'Файл данных {name} не найден')
+                continue
+            self.stdout.write(f'Начался импорт данных {file}')
+            started = time.monotonic()
+            created, updated, total = self.import_file(
+                model, file, file_format, fields, keys, options)
+            if created or updated:
+                bump_version(name)
+            self.stdout.write(self.style.SUCCESS(
+                f'Импорт данных {name} завершен: {total} строк за '
+                f'{time.monotonic() - started:.1f} с, добавлено {created}, '
+                f'обновлено {updated}.'))
 
     def handle(self, *args, **options):
         """ Агрегирующий метод, который вызывается с помощью команды import
         и добавляет тестовые данные в БД. """
 
-        self.import_data()
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть больше 0')
+        self.import_data(options)
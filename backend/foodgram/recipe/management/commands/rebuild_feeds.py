@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from recipe.feed import backfill
+from recipe.models import FeedItem
+from users.models import Subscribe
+
+
+class Command(BaseCommand):
+    help = ("Заново заполняет ленты подписок последними рецептами авторов, "
+            "например после первого развертывания лент")
+
+    def handle(self, *args, **options):
+        total = 0
+        with transaction.atomic():
+            FeedItem.objects.all().delete()
+            for user, author in Subscribe.objects.order_by(
+                    'pk').values_list('user_id', 'author_id').iterator():
+                backfill(user, author)
+                total += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты перестроены, подписок: {total}'))
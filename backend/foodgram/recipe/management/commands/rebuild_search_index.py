@@ -0,0 +1,30 @@
+from itertools import islice
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from recipe.models import Recipe
+from recipe.search import index_recipes
+
+
+class Command(BaseCommand):
+    help = "Перестраивает поисковый индекс рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество рецептов, индексируемых одной транзакцией')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by('pk').values_list(
+            'pk', flat=True).iterator()
+        total = 0
+        while True:
+            batch = list(islice(recipes, options['batch_size']))
+            if not batch:
+                break
+            with transaction.atomic():
+                index_recipes(batch)
+            total += len(batch)
+            self.stdout.write(f'  проиндексировано {total}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковый индекс перестроен, рецептов: {total}'))
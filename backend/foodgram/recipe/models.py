@@ -1,7 +1,11 @@
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
-from users.models import User
+from django.db import models, transaction
+from django.db.models import (BooleanField, Case, Exists, F, IntegerField,
+                              OuterRef, Prefetch, Sum, Value, When, Window)
+from django.db.models.functions import RowNumber
+from users.models import Subscribe, User
 
 
 class BaseModel(models.Model):
@@ -26,13 +30,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиент'
-
-    constraints = [
-        models.UniqueConstraint(
-            fields=('name', 'measurement_unit'),
-            name='unique_name_measurement_unit'
-        )
-    ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_name_measurement_unit'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -53,6 +56,72 @@ class Tag(BaseModel):
         verbose_name_plural = 'Теги'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """ Запросы рецептов с данными, необходимыми для их вывода. """
+
+    @staticmethod
+    def get_user_flags(user, author):
+        """ Выражения флагов пользователя: рецепт в избранном, в корзине и
+        подписка на автора, id которого лежит в поле author. """
+        if not user.is_authenticated:
+            flag = Value(False, output_field=BooleanField())
+            return flag, flag, flag
+        return (
+            Exists(Favorite.objects.filter(user=user, recipe=OuterRef('pk'))),
+            Exists(Basket.objects.filter(user=user, recipe=OuterRef('pk'))),
+            Exists(Subscribe.objects.filter(
+                user=user, author=OuterRef(author))))
+
+    def with_user_flags(self, user):
+        """ Добавляет флаги пользователя и подгружает связанные объекты
+        пачкой, чтобы число запросов не зависело от размера страницы. """
+        is_favorited, is_in_shopping_cart, is_subscribed = (
+            self.get_user_flags(user, 'pk'))
+        return self.annotate(
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart,
+        ).prefetch_related(
+            Prefetch('author', queryset=User.objects.annotate(
+                is_subscribed=is_subscribed)),
+            'tags',
+            Prefetch('ingredients',
+                     queryset=IngredientInRecipe.objects.select_related(
+                         'ingredient')),
+        )
+
+    def with_documents(self, user):
+        """ Добавляет флаги пользователя и готовые документы рецептов, так
+        что страница рецептов читается одним запросом. """
+        is_favorited, is_in_shopping_cart, is_subscribed = (
+            self.get_user_flags(user, 'author_id'))
+        return self.annotate(
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart,
+            is_subscribed=is_subscribed,
+        ).select_related('document')
+
+    def first_of_authors(self, authors, limit=None):
+        """ Первые рецепты каждого из авторов одним запросом.
+
+        Если задан limit, рецепты нумеруются оконной функцией внутри
+        автора и отбираются не больше limit на каждого. """
+        if not authors:
+            return []
+        queryset = self.filter(author__in=authors).order_by('author_id', 'id')
+        if limit is None:
+            return list(queryset)
+        ranked = queryset.annotate(author_rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=F('id').asc()))
+        sql, params = ranked.query.sql_with_params()
+        return list(self.raw(
+            f'SELECT * FROM ({sql}) ranked '
+            f'WHERE ranked.author_rank <= %s '
+            f'ORDER BY ranked.author_id, ranked.id',
+            (*params, limit)))
+
+
 class Recipe(BaseModel):
     author = models.ForeignKey(
         User,
@@ -68,6 +137,8 @@ class Recipe(BaseModel):
         null=True,
         default=None,
         help_text='Загрузите картинку')
+    has_renditions = models.BooleanField(
+        'Уменьшенные копии картинки готовы', default=False, editable=False)
     tags = models.ManyToManyField(
         Tag,
         through='TagOfRecipes',
@@ -76,11 +147,34 @@ class Recipe(BaseModel):
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления',
         validators=[MinValueValidator(1, 'Число дожно быть больше 1')])
+    created = models.DateTimeField('Дата создания', auto_now_add=True)
+    # Меняется и при изменении тегов, ингредиентов и автора рецепта
+    updated = models.DateTimeField(
+        'Дата изменения', auto_now=True, db_index=True)
+    favorites_count = models.PositiveIntegerField(
+        'Количество в избранном', default=0, editable=False)
+    basket_count = models.PositiveIntegerField(
+        'Количество в корзинах', default=0, editable=False)
+    # Взвешенная сумма счетчиков для сортировки по популярности
+    popularity = models.PositiveIntegerField(
+        'Популярность', default=0, editable=False)
+    # Поисковый вектор для PostgreSQL, на SQLite используется таблица FTS5.
+    # GIN индекс по нему создается после миграций, см. search.py
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-id',)
+        indexes = [
+            models.Index(fields=('author', 'id'), name='recipe_author_idx'),
+            models.Index(fields=('popularity', 'id'),
+                         name='recipe_popularity_idx'),
+            models.Index(fields=('cooking_time', 'id'),
+                         name='recipe_cooking_time_idx'),
+        ]
 
 
 class IngredientInRecipe(models.Model):
@@ -115,6 +209,9 @@ class TagOfRecipes(models.Model):
                 name='unique_recipe_tag'
             )
         ]
+        indexes = [
+            models.Index(fields=('tag', 'recipe'), name='tag_recipe_idx'),
+        ]
 
 
 class BasicModelOfUserRecipeRelationship(models.Model):
@@ -162,3 +259,126 @@ class Basket(BasicModelOfUserRecipeRelationship):
                 name='unique_basket_user_recipe'
             )
         ]
+
+
+class ShoppingCartItemManager(models.Manager):
+    """ Поддерживает суммы ингредиентов в корзинах в актуальном виде. """
+
+    @staticmethod
+    def get_amounts(recipe):
+        return dict(IngredientInRecipe.objects.filter(
+            recipe=recipe).values_list('ingredient_id', 'amount'))
+
+    def apply(self, users, deltas):
+        """ Прибавляет к суммам ингредиентов пользователей изменения deltas
+        вида {id ингредиента: количество}. """
+        users = list(users)
+        deltas = {ingredient: delta
+                  for ingredient, delta in deltas.items() if delta}
+        if not users or not deltas:
+            return
+        with transaction.atomic():
+            self.bulk_create([
+                self.model(user_id=user, ingredient_id=ingredient, amount=0)
+                for user in users
+                for ingredient, delta in deltas.items() if delta > 0
+            ], ignore_conflicts=True)
+            self.filter(
+                user_id__in=users, ingredient_id__in=deltas
+            ).update(amount=F('amount') + Case(
+                *[When(ingredient_id=ingredient, then=Value(delta))
+                  for ingredient, delta in deltas.items()],
+                default=Value(0), output_field=IntegerField()))
+            self.filter(user_id__in=users, amount__lte=0).delete()
+
+    def add_recipe(self, user, recipe):
+        self.apply([user.pk], self.get_amounts(recipe))
+
+    def add_recipes(self, user, recipes):
+        self.apply([user.pk], dict(IngredientInRecipe.objects.filter(
+            recipe__in=recipes
+        ).values('ingredient_id').annotate(
+            total=Sum('amount')).values_list('ingredient_id', 'total')))
+
+    def remove_recipe(self, user, recipe):
+        self.apply([user.pk], {
+            ingredient: -amount
+            for ingredient, amount in self.get_amounts(recipe).items()})
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """ Переносит изменение ингредиентов рецепта в корзины, где он лежит.
+        """
+        self.apply(
+            Basket.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True),
+            {ingredient: (new_amounts.get(ingredient, 0)
+                          - old_amounts.get(ingredient, 0))
+             for ingredient in {*old_amounts, *new_amounts}})
+
+    def delete_recipe(self, recipe):
+        self.change_recipe(recipe, self.get_amounts(recipe), {})
+
+
+class ShoppingCartItem(models.Model):
+    """ Сумма ингредиента по всем рецептам в корзине пользователя."""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_cart',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField('Количество')
+
+    objects = ShoppingCartItemManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_cart_user_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.ingredient}'
+
+
+class RecipeDocument(models.Model):
+    """ Готовое представление рецепта без данных пользователя. """
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE, primary_key=True,
+        related_name='document', verbose_name='Рецепт')
+    data = models.TextField('Документ в JSON')
+
+    class Meta:
+        verbose_name = 'Документ рецепта'
+        verbose_name_plural = 'Документы рецептов'
+
+
+class FeedItem(models.Model):
+    """ Рецепт в ленте подписок пользователя, разложенный при публикации.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='feed',
+        verbose_name='Пользователь')
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='+',
+        verbose_name='Рецепт')
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+',
+        verbose_name='Автор')
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Рецепты в ленте'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_user_recipe'
+            )
+        ]
@@ -0,0 +1,159 @@
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections
+from django.db.models import F, FloatField, OuterRef, Subquery
+from django.db.models.expressions import RawSQL
+from django.db.models.sql.constants import INNER
+
+from .models import IngredientInRecipe, Recipe
+
+# Таблица FTS5, заменяющая поисковый вектор на SQLite
+FTS_TABLE = 'recipe_recipe_fts'
+# Веса полей в bm25: название, текст, ингредиенты
+FTS_WEIGHTS = '10.0, 4.0, 1.0'
+# GIN индекс поискового вектора на PostgreSQL
+SEARCH_INDEX = 'recipe_search_idx'
+# Сколько рецептов индексируется одним запросом
+INDEX_BATCH_SIZE = 500
+
+
+class MatchJoin:
+    """ INNER JOIN рецептов с результатами поиска в таблице FTS5.
+
+    MATCH и bm25 выполняются в подзапросе один раз на весь запрос, а не для
+    каждой строки рецепта. LIMIT не дает SQLite встроить подзапрос во
+    внешний запрос, где bm25 недоступна. Реализует то, что Query.alias_map
+    требует от Join. """
+    join_type = INNER
+    nullable = False
+    filtered_relation = None
+
+    def __init__(self, parent_alias, match, table_alias=None):
+        self.table_name = FTS_TABLE
+        self.parent_alias = parent_alias
+        self.table_alias = table_alias
+        self.match = match
+
+    def as_sql(self, compiler, connection):
+        qn = compiler.quote_name_unless_alias
+        return (
+            f'INNER JOIN (SELECT rowid, -bm25({FTS_TABLE}, {FTS_WEIGHTS}) '
+            f'AS rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'LIMIT -1) '
+            f'{qn(self.table_alias)} ON ({qn(self.table_alias)}.rowid = '
+            f'{qn(self.parent_alias)}.{connection.ops.quote_name("id")})',
+            [self.match])
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(
+            change_map.get(self.parent_alias, self.parent_alias), self.match,
+            change_map.get(self.table_alias, self.table_alias))
+
+    def equals(self, other, with_filtered_relation):
+        return (isinstance(other, self.__class__)
+                and self.parent_alias == other.parent_alias
+                and self.match == other.match)
+
+    def __eq__(self, other):
+        return self.equals(other, with_filtered_relation=True)
+
+    def __hash__(self):
+        return hash((self.__class__, self.parent_alias, self.match))
+
+
+def create_fts_table(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+            f'USING fts5(name, text, ingredients)')
+
+
+def create_search_index(schema_editor):
+    """ Создает GIN индекс поискового вектора. Он есть только на
+    PostgreSQL, поэтому создается после миграций, а не в Meta.indexes,
+    и миграции не зависят от настроек БД. """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} ON '
+        f'{schema_editor.quote_name(Recipe._meta.db_table)} '
+        f'USING gin ({schema_editor.quote_name("search_vector")})')
+
+
+def index_recipes(recipes):
+    """ Обновляет поисковый индекс рецептов с переданными id. """
+    recipes = list(recipes)
+    for start in range(0, len(recipes), INDEX_BATCH_SIZE):
+        index_batch(recipes[start:start + INDEX_BATCH_SIZE])
+
+
+def index_batch(recipes):
+    connection = connections[Recipe.objects.db]
+    if connection.vendor == 'postgresql':
+        config = settings.SEARCH_CONFIG
+        ingredients = IngredientInRecipe.objects.filter(
+            recipe=OuterRef('pk')
+        ).values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+        Recipe.objects.filter(pk__in=recipes).update(search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector('text', weight='B', config=config)
+            + SearchVector(Subquery(ingredients), weight='C', config=config)))
+        return
+    names = {}
+    for recipe, name in IngredientInRecipe.objects.filter(
+            recipe__in=recipes).values_list('recipe_id', 'ingredient__name'):
+        names.setdefault(recipe, []).append(name)
+    rows = [
+        (recipe.pk, recipe.name, recipe.text,
+         ' '.join(names.get(recipe.pk, ())))
+        for recipe in Recipe.objects.filter(pk__in=recipes).only(
+            'name', 'text')]
+    unindex_recipes(recipes)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+            f'VALUES (%s, %s, %s, %s)', rows)
+
+
+def unindex_recipes(recipes):
+    """ Убирает рецепты из таблицы FTS5 (на PostgreSQL вектор хранится в
+    самой строке рецепта). """
+    recipes = list(recipes)
+    connection = connections[Recipe.objects.db]
+    if connection.vendor == 'postgresql' or not recipes:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN '
+            f'({", ".join(["%s"] * len(recipes))})', list(recipes))
+
+
+def get_fts_query(query):
+    """ Запрос FTS5: все слова, каждое как префикс. """
+    words = ''.join(
+        char if char.isalnum() else ' ' for char in query).split()
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_recipes(queryset, query, by_rank=True):
+    """ Фильтрует рецепты по поисковому запросу. С by_rank сортирует их по
+    релевантности, а при равной - по id. Релевантность не выбирается в
+    SELECT, поэтому count() ее не вычисляет. """
+    if connections[queryset.db].vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=settings.SEARCH_CONFIG, search_type='plain')
+        queryset = queryset.filter(search_vector=search_query)
+        rank = SearchRank(F('search_vector'), search_query)
+    else:
+        match = get_fts_query(query)
+        if not match:
+            return queryset.none()
+        queryset = queryset.all()
+        alias = queryset.query.join(
+            MatchJoin(queryset.query.get_initial_alias(), match))
+        rank = RawSQL(f'"{alias}"."rank"', (), output_field=FloatField())
+    return queryset.order_by(rank.desc(), 'id') if by_rank else queryset
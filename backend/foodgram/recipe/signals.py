@@ -0,0 +1,158 @@
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+from users.models import Subscribe, User
+
+from .cache import bump_version, get_user_state_namespace
+from .counters import COUNTERS, change_counter
+from .feed import backfill, fan_out, remove
+from .models import Basket, Favorite, Ingredient, Recipe, RecipeDocument, Tag
+from .search import (create_fts_table, create_search_index, index_recipes,
+                     unindex_recipes)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(instance, **kwargs):
+    namespaces = ('tags', f'tag:{instance.pk}')
+    transaction.on_commit(lambda: bump_version(*namespaces))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(instance, **kwargs):
+    namespaces = ('ingredients', f'ingredient:{instance.pk}')
+    transaction.on_commit(lambda: bump_version(*namespaces))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipe_version(instance, **kwargs):
+    namespaces = ('recipes', f'recipe:{instance.pk}')
+    transaction.on_commit(lambda: bump_version(*namespaces))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_version(instance, update_fields=None, **kwargs):
+    # Вход пользователя меняет только last_login, которого нет в ответах
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    namespace = f'user:{instance.pk}'
+    transaction.on_commit(lambda: bump_version(namespace))
+
+
+@receiver(post_save, sender=Recipe)
+def drop_recipe_document(instance, created, **kwargs):
+    if not created:
+        RecipeDocument.objects.filter(recipe=instance).delete()
+
+
+@receiver(post_save, sender=Recipe)
+def reindex_recipe(instance, **kwargs):
+    # Ингредиенты сохраняются после рецепта, в том числе в админке,
+    # поэтому индекс обновляется после транзакции
+    transaction.on_commit(lambda: index_recipes([instance.pk]))
+
+
+def mark_changed(recipes):
+    """ Сбрасывает документы рецептов, обновляет дату их изменения и после
+    транзакции - их поисковый индекс. """
+    ids = list(recipes.values_list('pk', flat=True))
+    RecipeDocument.objects.filter(recipe__in=recipes).delete()
+    recipes.update(updated=timezone.now())
+    transaction.on_commit(lambda: index_recipes(ids))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def mark_tag_recipes_changed(instance, **kwargs):
+    mark_changed(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def mark_ingredient_recipes_changed(instance, **kwargs):
+    mark_changed(Recipe.objects.filter(ingredients__ingredient=instance))
+
+
+@receiver(post_save, sender=User)
+def mark_author_recipes_changed(instance, created, update_fields=None,
+                                **kwargs):
+    if created or (update_fields is not None
+                   and set(update_fields) == {'last_login'}):
+        return
+    mark_changed(Recipe.objects.filter(author=instance))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=Basket)
+@receiver(post_delete, sender=Basket)
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+def bump_user_state_version(instance, **kwargs):
+    namespace = get_user_state_namespace(instance.user_id)
+    transaction.on_commit(lambda: bump_version(namespace))
+
+
+@receiver(connection_created)
+def prepare_search_table(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        create_fts_table(connection)
+
+
+@receiver(post_migrate)
+def prepare_search_index(sender, using, **kwargs):
+    if sender.label == 'recipe':
+        with connections[using].schema_editor() as schema_editor:
+            create_search_index(schema_editor)
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(instance, **kwargs):
+    unindex_recipes([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Basket)
+@receiver(post_save, sender=Subscribe)
+def increment_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counters(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Basket)
+@receiver(post_delete, sender=Subscribe)
+def decrement_counter(sender, instance, **kwargs):
+    change_counters(sender, instance, -1)
+
+
+def change_counters(sender, instance, delta):
+    for model, counter, related, field in COUNTERS:
+        if related is sender:
+            change_counter(model, counter,
+                           [getattr(instance, f'{field}_id')], delta)
+
+
+@receiver(post_save, sender=Recipe)
+def add_to_feeds(instance, created, **kwargs):
+    if created:
+        fan_out(instance)
+
+
+@receiver(post_save, sender=Subscribe)
+def fill_feed(instance, created, **kwargs):
+    if created:
+        backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def clean_feed(instance, **kwargs):
+    remove(instance.user_id, instance.author_id)
@@ -0,0 +1,68 @@
+import pytest
+from django.core.cache import cache, caches
+from recipe.models import (Ingredient, IngredientInRecipe, Recipe, Tag,
+                           TagOfRecipes)
+from rest_framework.test import APIClient
+from users.models import User
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    cache.clear()
+    caches['responses'].clear()
+
+
+@pytest.fixture(autouse=True)
+def strict_n_plus_one(settings):
+    # Повтор запроса в N+1 роняет тест, а не пишется в журнал
+    settings.NPLUSONE_MODE = 'raise'
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(
+        email='user@example.com', username='user', first_name='Иван',
+        last_name='Иванов', password='password')
+
+
+@pytest.fixture
+def author():
+    return User.objects.create_user(
+        email='author@example.com', username='author', first_name='Петр',
+        last_name='Петров', password='password')
+
+
+@pytest.fixture
+def anonymous_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def recipes(author):
+    tags = [Tag.objects.create(name=f'Тег {number}', color='#E26C2D',
+                               slug=f'tag{number}')
+            for number in range(2)]
+    ingredients = [
+        Ingredient.objects.create(name=f'Ингредиент {number}',
+                                  measurement_unit='г')
+        for number in range(3)]
+    recipes = []
+    for number in range(10):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {number}', text='Текст',
+            image='recipes/images/recipe.png', cooking_time=10)
+        TagOfRecipes.objects.bulk_create(
+            TagOfRecipes(recipe=recipe, tag=tag) for tag in tags)
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                               amount=number + 1)
+            for ingredient in ingredients)
+        recipes.append(recipe)
+    return recipes
@@ -0,0 +1,71 @@
+import pytest
+from django.db.models.signals import pre_delete
+from recipe.models import Favorite, Recipe, ShoppingCartItem
+from users.models import Subscribe
+
+
+def delete_concurrently(sender, instance, **kwargs):
+    """ Удаляет строку до запроса Django, как параллельный запрос. """
+    sender.objects.filter(pk=instance.pk)._raw_delete(sender.objects.db)
+
+
+@pytest.fixture
+def concurrent_delete():
+    for model in (Favorite, Subscribe, Recipe):
+        pre_delete.connect(delete_concurrently, sender=model)
+    yield
+    for model in (Favorite, Subscribe, Recipe):
+        pre_delete.disconnect(delete_concurrently, sender=model)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_favorite_delete_counts_only_deleted_rows(
+        user, user_client, recipes, concurrent_delete):
+    recipe = recipes[0]
+    user_client.post(f'/api/recipes/{recipe.pk}/favorite/')
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 1
+    response = user_client.delete(f'/api/recipes/{recipe.pk}/favorite/')
+    assert response.status_code == 404
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_unsubscribe_counts_only_deleted_rows(
+        user, user_client, author, concurrent_delete):
+    user_client.post(f'/api/users/{author.pk}/subscribe/')
+    author.refresh_from_db()
+    assert author.followers_count == 1
+    response = user_client.delete(f'/api/users/{author.pk}/subscribe/')
+    assert response.status_code == 404
+    author.refresh_from_db()
+    assert author.followers_count == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipe_delete_counts_only_deleted_rows(
+        author, user_client, recipes, concurrent_delete):
+    recipe = recipes[0]
+    user_client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+    amounts = dict(ShoppingCartItem.objects.values_list(
+        'ingredient_id', 'amount'))
+    user_client.force_authenticate(author)
+    response = user_client.delete(f'/api/recipes/{recipe.pk}/')
+    assert response.status_code == 404
+    author.refresh_from_db()
+    assert author.recipes_count == len(recipes)
+    assert dict(ShoppingCartItem.objects.values_list(
+        'ingredient_id', 'amount')) == amounts
+
+
+@pytest.mark.django_db
+def test_favorite_delete_decrements_counter(user_client, recipes):
+    recipe = recipes[0]
+    user_client.post(f'/api/recipes/{recipe.pk}/favorite/')
+    assert user_client.delete(
+        f'/api/recipes/{recipe.pk}/favorite/').status_code == 204
+    assert user_client.delete(
+        f'/api/recipes/{recipe.pk}/favorite/').status_code == 404
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 0
@@ -0,0 +1,27 @@
+import io
+
+import pytest
+from api.documents import build_documents
+from django.core.management import call_command
+from recipe.models import RecipeDocument
+
+pytestmark = pytest.mark.django_db
+
+
+def check(**options):
+    out = io.StringIO()
+    call_command('check_recipe_documents', stdout=out, **options)
+    return out.getvalue()
+
+
+def test_missing_documents_are_not_drift(recipes):
+    build_documents([recipes[0].pk])
+    assert 'актуальны' in check()
+
+
+def test_stale_documents_are_reported_and_repaired(recipes):
+    build_documents([recipe.pk for recipe in recipes])
+    RecipeDocument.objects.filter(recipe=recipes[0]).update(data='{}')
+    assert 'Устарело документов: 1' in check()
+    check(repair=True)
+    assert 'еще не построено: 0' in check()
@@ -0,0 +1,22 @@
+import pytest
+from recipe.feed import get_feed_ids
+from recipe.models import Recipe
+from users.models import Subscribe, User
+
+
+@pytest.mark.django_db
+def test_feed_keeps_recipes_after_author_drops_to_fanout_limit(
+        settings, user, author):
+    settings.FEED_FANOUT_LIMIT = 1
+    other = User.objects.create_user(
+        email='other@example.com', username='other', first_name='Анна',
+        last_name='Сидорова', password='password')
+    Subscribe.objects.create(user=user, author=author)
+    Subscribe.objects.create(user=other, author=author)
+    recipe = Recipe.objects.create(
+        author=author, name='Рецепт', text='Текст',
+        image='recipes/images/recipe.png', cooking_time=10)
+    assert get_feed_ids(user) == [recipe.pk]
+
+    Subscribe.objects.get(user=other, author=author).delete()
+    assert get_feed_ids(user) == [recipe.pk]
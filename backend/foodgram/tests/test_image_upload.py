@@ -0,0 +1,63 @@
+import base64
+import io
+import os
+
+import pytest
+from api.fields import BASE64_CHUNK_SIZE, StreamingBase64ImageField
+from PIL import Image
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+@pytest.fixture
+def recipe_data(recipes):
+    recipe = recipes[0]
+    return {
+        'name': 'Новый рецепт', 'text': 'Текст', 'cooking_time': 5,
+        'tags': [recipe.tags.first().pk],
+        'ingredients': [{'id': recipe.ingredients.first().ingredient_id,
+                         'amount': 1}]}
+
+
+def make_png(size):
+    image = io.BytesIO()
+    Image.new('RGB', size, '#E26C2D').save(image, 'PNG')
+    return image.getvalue()
+
+
+def test_base64_upload_closes_temporary_file(
+        user_client, recipe_data, monkeypatch):
+    decoded = []
+    decode = StreamingBase64ImageField.decode
+
+    def record(field, data):
+        decoded.append(decode(field, data))
+        return decoded[-1]
+
+    monkeypatch.setattr(StreamingBase64ImageField, 'decode', record)
+    encoded = base64.b64encode(make_png((10, 10))).decode()
+    response = user_client.post('/api/recipes/', {
+        **recipe_data, 'image': f'data:image/png;base64,{encoded}'},
+        format='json')
+    assert response.status_code == 201, response.content
+    assert decoded[0].closed
+
+
+@pytest.mark.parametrize('encode', (base64.b64encode, base64.encodebytes))
+def test_base64_upload_accepts_wrapped_lines(
+        user_client, recipe_data, encode):
+    # Шум почти не сжимается, и строка длиннее куска BASE64_CHUNK_SIZE
+    image = io.BytesIO()
+    Image.frombytes('RGB', (300, 300), os.urandom(300 * 300 * 3)).save(
+        image, 'PNG')
+    encoded = encode(image.getvalue()).decode()
+    assert len(encoded) > 4 * BASE64_CHUNK_SIZE
+    response = user_client.post('/api/recipes/', {
+        **recipe_data, 'image': f'data:image/png;base64,{encoded}'},
+        format='json')
+    assert response.status_code == 201, response.content
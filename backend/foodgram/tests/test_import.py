@@ -0,0 +1,22 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from recipe.cache import get_version
+from recipe.models import Recipe
+
+
+@pytest.mark.django_db(transaction=True)
+def test_import_update_marks_tag_recipes_changed(recipes, tmp_path):
+    tag = recipes[0].tags.first()
+    updated = Recipe.objects.get(pk=recipes[0].pk).updated
+    version = get_version(f'tag:{tag.pk}')
+    (tmp_path / 'tags.json').write_text(json.dumps([{
+        'name': 'Новое имя', 'color': tag.color, 'slug': tag.slug}]))
+    call_command('import', path=str(tmp_path), update=True,
+                 stdout=io.StringIO(), stderr=io.StringIO())
+    tag.refresh_from_db()
+    assert tag.name == 'Новое имя'
+    assert Recipe.objects.get(pk=recipes[0].pk).updated > updated
+    assert get_version(f'tag:{tag.pk}') != version
@@ -0,0 +1,58 @@
+import pytest
+from perf.middleware import Timings
+
+pytestmark = pytest.mark.django_db
+
+
+def get_timings(response):
+    return dict(
+        (part.split(';')[0], part) for part in
+        response['Server-Timing'].split(', '))
+
+
+def test_serialization_is_timed_separately(client, recipes, monkeypatch):
+    captured = []
+    init = Timings.__init__
+
+    def capture(timings):
+        init(timings)
+        captured.append(timings)
+
+    monkeypatch.setattr(Timings, '__init__', capture)
+    response = client.get('/api/recipes/')
+    assert response.status_code == 200
+    timings = captured[0]
+    assert timings.serialize > 0
+    assert not timings.serializing
+    header = get_timings(response)
+    assert header['serialize'] == (
+        f'serialize;dur={timings.serialize * 1000:.1f}')
+    assert header['view'] == f'view;dur={timings.view * 1000:.1f}'
+    assert timings.view + timings.serialize <= timings.total
+
+
+def test_metrics_are_closed_by_default(client, settings):
+    settings.METRICS_TOKEN = ''
+    assert client.get('/metrics').status_code == 403
+    assert client.get(
+        '/metrics', HTTP_AUTHORIZATION='Bearer ').status_code == 403
+
+
+def test_metrics_token(client, settings):
+    settings.METRICS_TOKEN = 'secret'
+    assert client.get(
+        '/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code == 403
+    response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+    assert response.status_code == 200
+
+
+def test_metrics_for_staff(client, user, recipes, settings):
+    settings.METRICS_TOKEN = ''
+    client.force_login(user)
+    assert client.get('/metrics').status_code == 403
+    user.is_staff = True
+    user.save()
+    client.get('/api/recipes/')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert b'foodgram_request_serialize_seconds_total' in response.content
@@ -0,0 +1,20 @@
+import pytest
+from api.serializers import RecipeSerializer
+from perf.nplusone import NPlusOneError, detect_n_plus_one
+from recipe.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+def test_repeated_query_raises(recipes):
+    with pytest.raises(NPlusOneError, match='RecipeSerializer'):
+        with detect_n_plus_one():
+            RecipeSerializer(Recipe.objects.all(), many=True).data
+
+
+def test_prefetched_queryset_passes(recipes):
+    with detect_n_plus_one() as repeats:
+        RecipeSerializer(Recipe.objects.select_related('author')
+                         .prefetch_related('tags', 'ingredients__ingredient'),
+                         many=True).data
+    assert repeats.get_repeats() == []
@@ -0,0 +1,21 @@
+import pytest
+
+
+@pytest.mark.django_db
+def test_cursor_pagination_by_id(anonymous_client, recipes):
+    response = anonymous_client.get('/api/recipes/?pagination=cursor&limit=3')
+    data = response.json()
+    assert 'cursor=' in data['next']
+    assert [recipe['id'] for recipe in data['results']] == [
+        recipe.pk for recipe in recipes[:3]]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('ordering', ('popularity', '-cooking_time'))
+def test_cursor_pagination_falls_back_for_non_unique_ordering(
+        anonymous_client, recipes, ordering):
+    response = anonymous_client.get(
+        f'/api/recipes/?pagination=cursor&limit=3&ordering={ordering}')
+    data = response.json()
+    assert data['count'] == len(recipes)
+    assert 'page=2' in data['next']
@@ -0,0 +1,38 @@
+import pytest
+from perf.models import Profile
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def profile_dir(settings, tmp_path):
+    settings.PROFILE_DIR = str(tmp_path)
+
+
+def test_staff_session_is_profiled(client, user):
+    user.is_staff = True
+    user.save()
+    client.force_login(user)
+    response = client.get('/api/tags/?_profile=1')
+    assert response.status_code == 200
+    assert Profile.objects.get(pk=response['X-Profile-Id']).user == user
+
+
+def test_staff_token_is_profiled(user):
+    user.is_staff = True
+    user.save()
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+    response = client.get('/api/tags/', HTTP_X_PROFILE='1')
+    assert Profile.objects.get(pk=response['X-Profile-Id']).user == user
+
+
+def test_non_staff_is_not_profiled(client, user):
+    client.force_login(user)
+    response = client.get('/api/tags/?_profile=1')
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response
+    assert not Profile.objects.exists()
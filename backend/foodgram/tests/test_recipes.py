@@ -0,0 +1,52 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+
+def get_with_queries(client, url):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200, response.content
+    return response.json(), len(queries)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('client_name', ('anonymous_client', 'user_client'))
+def test_recipe_list_queries_do_not_grow_with_page_size(
+        request, client_name, recipes):
+    client = request.getfixturevalue(client_name)
+    small, small_queries = get_with_queries(client, '/api/recipes/?limit=1')
+    large, large_queries = get_with_queries(
+        client, f'/api/recipes/?limit={len(recipes)}')
+    assert len(small['results']) == 1
+    assert len(large['results']) == len(recipes)
+    assert large_queries == small_queries
+
+
+@pytest.mark.django_db
+def test_recipe_list_returns_user_flags(user, user_client, recipes):
+    user.favorites.create(recipe=recipes[0])
+    user.baskets.create(recipe=recipes[0])
+    data, _ = get_with_queries(user_client, '/api/recipes/?limit=100')
+    flags = {recipe['id']: (recipe['is_favorited'],
+                            recipe['is_in_shopping_cart'])
+             for recipe in data['results']}
+    assert flags[recipes[0].pk] == (True, True)
+    assert flags[recipes[1].pk] == (False, False)
+
+
+@pytest.mark.django_db
+def test_recipe_update_reads_old_tags_once(author, recipes):
+    client = APIClient()
+    client.force_authenticate(author)
+    recipe = recipes[0]
+    tags = list(recipe.tags.values_list('id', flat=True))
+    with CaptureQueriesContext(connection) as queries:
+        response = client.patch(f'/api/recipes/{recipe.pk}/', {
+            'tags': tags[:1]}, format='json')
+    assert response.status_code == 200, response.content
+    assert len([
+        query for query in queries if query['sql'].startswith(
+            'SELECT "recipe_tagofrecipes"."tag_id"')]) == 1
+    assert list(recipe.tags.values_list('id', flat=True)) == tags[:1]
@@ -0,0 +1,38 @@
+import pytest
+from api.caching import get_response_key
+from django.core.cache import caches
+from recipe.cache import bump_version, get_version, versions_cache
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+
+@pytest.mark.django_db
+def test_waiter_does_not_release_foreign_lock(
+        settings, anonymous_client, recipes):
+    settings.RESPONSE_CACHE_LOCK_TIMEOUT = 0.1
+    response_cache = caches['responses']
+    key = get_response_key(
+        Request(APIRequestFactory().get('/api/recipes/?limit=1')))
+    response_cache.add(f'{key}:lock', 1, 60)
+
+    response = anonymous_client.get('/api/recipes/?limit=1')
+
+    assert response['X-Cache'] == 'MISS'
+    assert response_cache.get(f'{key}:lock') == 1
+
+
+@pytest.mark.django_db
+def test_cached_links_use_request_host(anonymous_client, recipes):
+    first = anonymous_client.get(
+        '/api/recipes/?limit=1', HTTP_HOST='first.example.com')
+    second = anonymous_client.get(
+        '/api/recipes/?limit=1', HTTP_HOST='second.example.com')
+    assert first.json()['next'].startswith('http://first.example.com/')
+    assert second.json()['next'].startswith('http://second.example.com/')
+
+
+def test_versions_live_in_response_cache():
+    version = get_version('recipes')
+    bump_version('recipes')
+    assert versions_cache is caches['responses']
+    assert versions_cache.get('version:recipes') == version + 1
@@ -0,0 +1,54 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from recipe.search import index_recipes
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def indexed(recipes):
+    recipes[3].name = 'Борщ'
+    recipes[3].save()
+    recipes[5].text = 'Борщ не нужен'
+    recipes[5].save()
+    index_recipes(recipe.pk for recipe in recipes)
+    return recipes
+
+
+def test_search_by_rank(anonymous_client, indexed):
+    data = anonymous_client.get('/api/recipes/?search=борщ').json()
+    assert data['count'] == 2
+    assert [recipe['id'] for recipe in data['results']] == [
+        indexed[3].pk, indexed[5].pk]
+
+
+def test_search_matches_once_per_query(anonymous_client, indexed):
+    with CaptureQueriesContext(connection) as queries:
+        anonymous_client.get('/api/recipes/?search=борщ')
+    searches = [query['sql'] for query in queries if 'MATCH' in query['sql']]
+    assert searches
+    for sql in searches:
+        assert sql.count('MATCH') == 1
+    count = next(sql for sql in searches if 'COUNT(' in sql)
+    assert 'rank' not in count.split('INNER JOIN')[0]
+
+
+def search(client, query):
+    return [recipe['id'] for recipe in client.get(
+        f'/api/recipes/?search={query}&limit=20').json()['results']]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_index_follows_orm_edits(anonymous_client, recipes):
+    recipe = recipes[0]
+    recipe.name = 'Окрошка'
+    recipe.save()
+    assert search(anonymous_client, 'окрошка') == [recipe.pk]
+    ingredient = recipe.ingredients.first().ingredient
+    ingredient.name = 'Редис'
+    ingredient.save()
+    assert set(search(anonymous_client, 'редис')) == {
+        recipe.pk for recipe in recipes}
+    ingredient.delete()
+    assert search(anonymous_client, 'редис') == []
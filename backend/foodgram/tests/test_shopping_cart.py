@@ -0,0 +1,52 @@
+import pytest
+from django.db.models import Sum
+from recipe.models import Basket, IngredientInRecipe, ShoppingCartItem
+from rest_framework.test import APIClient
+
+pytestmark = pytest.mark.django_db
+
+
+def stored_amounts(user):
+    return dict(ShoppingCartItem.objects.filter(user=user).values_list(
+        'ingredient_id', 'amount'))
+
+
+def live_amounts(user):
+    return dict(IngredientInRecipe.objects.filter(
+        recipe__in=Basket.objects.filter(user=user).values('recipe')
+    ).values('ingredient_id').annotate(
+        total=Sum('amount')).values_list('ingredient_id', 'total'))
+
+
+@pytest.fixture
+def author_client(author):
+    client = APIClient()
+    client.force_authenticate(author)
+    return client
+
+
+def test_shopping_list_follows_cart_and_recipe_changes(
+        user, user_client, author_client, recipes):
+    def check(response, status_code):
+        assert response.status_code == status_code, response.content
+        assert stored_amounts(user) == live_amounts(user)
+
+    first, second, third, fourth = recipes[:4]
+    check(user_client.post(f'/api/recipes/{first.pk}/shopping_cart/'), 201)
+    check(user_client.post('/api/recipes/shopping_cart/', {
+        'recipes': [first.pk, second.pk, third.pk, fourth.pk]},
+        format='json'), 201)
+    check(user_client.delete(f'/api/recipes/{second.pk}/shopping_cart/'),
+          204)
+    ingredients = list(third.ingredients.values_list(
+        'ingredient_id', flat=True))
+    check(author_client.patch(f'/api/recipes/{third.pk}/', {
+        'ingredients': [{'id': ingredients[0], 'amount': 7},
+                        {'id': ingredients[1], 'amount': 1}]},
+        format='json'), 200)
+    check(author_client.delete(f'/api/recipes/{fourth.pk}/'), 204)
+    check(user_client.delete(f'/api/recipes/{first.pk}/shopping_cart/'),
+          204)
+    check(user_client.delete(f'/api/recipes/{third.pk}/shopping_cart/'),
+          204)
+    assert stored_amounts(user) == {}
@@ -15,6 +15,10 @@ class User(AbstractUser):
     last_name = models.CharField(
         'Фамилия',
         max_length=settings.MAX_LENGTH_FOR_NAME_OF_MODELS)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False)
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
 
@@ -27,6 +31,13 @@ class User(AbstractUser):
         return self.username
 
 
+def lock_user(user):
+    """ Блокирует строку пользователя до конца транзакции, чтобы его
+    параллельные добавления в избранное и корзину шли по очереди. """
+    list(User.objects.select_for_update().filter(
+        pk=user.pk).values_list('pk'))
+
+
 class Subscribe(models.Model):
     user = models.ForeignKey(
         User,